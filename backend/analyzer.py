@@ -3,15 +3,21 @@ Main Screen Analyzer for Desktop Pet AI
 Orchestrates capture, detection, and UI inspection
 """
 
+import threading
 import time
 from typing import Dict, List, Optional
+import numpy as np
 from PIL import Image
 
 from capture import ScreenCapture
-from detector import ContentDetector
+from detector import ContentDetector, TESSERACT_AVAILABLE
 from ui_inspector import UIInspector
 
 
+# OCR hits on the tab strip that are browser chrome rather than tab titles
+TAB_STOP_WORDS = ['×', '+', '...', 'New Tab', 'Google', 'Chrome']
+
+
 class ScreenAnalyzer:
     """Main orchestrator for screen analysis"""
     
@@ -25,15 +31,116 @@ class ScreenAnalyzer:
         """
         print("Initializing Screen Analyzer...")
         self.capture = ScreenCapture()
-        self.detector = ContentDetector(ocr_engine=ocr_engine, use_gpu=use_gpu)
-        self.inspector = UIInspector()
+        
+        # OCR models and UI Automation are loaded on first use
+        self.ocr_engine = ocr_engine
+        self.use_gpu = use_gpu
+        self._detector = None
+        self._inspector = None
+        # Separate locks, so UI inspection never waits on a slow OCR load
+        self._detector_lock = threading.Lock()
+        self._inspector_lock = threading.Lock()
         print("✓ Screen Analyzer ready!\n")
     
-    def _extract_tabs_with_ocr(self, hwnd: int, screenshot: Image, debug=False) -> List[str]:
-        """Extract browser tabs using OCR on the tab bar area"""
+    @property
+    def detector(self) -> ContentDetector:
+        """OCR/CV detector, created on first access"""
+        if self._detector is None:
+            with self._detector_lock:
+                if self._detector is None:
+                    self._detector = ContentDetector(ocr_engine=self.ocr_engine, use_gpu=self.use_gpu)
+        return self._detector
+    
+    @property
+    def inspector(self) -> UIInspector:
+        """UI Automation inspector, created on first access"""
+        if self._inspector is None:
+            with self._inspector_lock:
+                if self._inspector is None:
+                    self._inspector = UIInspector()
+        return self._inspector
+    
+    def preload_detector(self):
+        """Load the OCR models (and run their warmup) on a background thread"""
+        def load():
+            try:
+                self.detector
+            except Exception as e:
+                print(f"⚠️ OCR preload failed: {e}")
+        
+        threading.Thread(target=load, daemon=True).start()
+    
+    def close(self):
+        """Release capture workers and screen-grab handles"""
+        self.capture.close()
+    
+    def _detect_tab_text(self, tab_region: Image) -> List[Dict]:
+        """OCR a tab-bar strip, preferring Tesseract's single-line mode"""
+        words = self.detector.detect_text_tesseract(tab_region, psm=7) if TESSERACT_AVAILABLE else []
+        if not words:
+            # No Tesseract (or it failed/found nothing): EasyOCR, as before.
+            # The strip is only ~40px tall, so don't shrink it further
+            return self.detector.detect_text(tab_region, max_side=None)
+        
+        words.sort(key=lambda x: x['bbox'][0])
+        
+        # Tesseract reports single words; merge neighbours into tab titles
+        merged = []
+        for word in words:
+            if merged and word['bbox'][0] - merged[-1]['bbox'][2] < 12:
+                last = merged[-1]
+                last['text'] = f"{last['text']} {word['text']}"
+                last['bbox'][2] = max(last['bbox'][2], word['bbox'][2])
+                last['bbox'][1] = min(last['bbox'][1], word['bbox'][1])
+                last['bbox'][3] = max(last['bbox'][3], word['bbox'][3])
+                last['confidence'] = min(last['confidence'], word['confidence'])
+            else:
+                merged.append(word)
+        
+        return merged
+    
+    @staticmethod
+    def _filter_tab_titles(detections: List[Dict], strict: bool = True) -> List[str]:
+        """
+        Pick plausible tab titles out of tab-bar OCR detections
+        
+        Args:
+            detections: OCR detections from the tab strip
+            strict: Also drop near-duplicate positions, UI labels and URLs
+        """
+        if not detections:
+            return []
+        
+        # Sort by horizontal position (tabs are left to right)
+        xs = np.fromiter((d['bbox'][0] for d in detections), dtype=np.int64, count=len(detections))
+        order = np.argsort(xs, kind='stable')
+        xs = xs[order]
+        texts = np.array([detections[i]['text'].strip() for i in order], dtype=str)
+        
+        # Reasonable tab title length (also drops empty strings)
+        lengths = np.char.str_len(texts)
+        keep = (lengths > 2) & (lengths < 60)
+        
+        if strict:
+            # Not UI elements or URLs
+            keep &= ~np.isin(texts, TAB_STOP_WORDS)
+            keep &= ~(np.char.startswith(texts, 'http') | np.char.startswith(texts, 'www'))
+            
+            # At least 30px right of the last accepted tab (new tab, not repeated text).
+            # Sequential by nature, so loop over the few surviving candidates
+            last_x = -100
+            for i in np.flatnonzero(keep):
+                if xs[i] - last_x > 30:
+                    last_x = xs[i]
+                else:
+                    keep[i] = False
+        
+        return texts[keep].tolist()
+    
+    def _extract_tabs_with_ocr(self, window_bbox, screenshot: Image, debug=False) -> List[str]:
+        """Extract browser tabs using OCR on the tab bar area of an already-captured window"""
         try:
-            rect = self.inspector.get_window_info(hwnd)['bbox']
-            width = rect[2] - rect[0]
+            width = window_bbox[2] - window_bbox[0]
             
             # Chrome/Edge tab bar is at pixels 0-40 from top
             # Avoid the address bar (starts around pixel 80+)
@@ -45,31 +152,9 @@ class ScreenAnalyzer:
                 print(f"   [DEBUG] Saved tab region to debug_tab_region.png")
             
             # Use OCR to detect text in tab bar ONLY
-            detections = self.detector.detect_text(tab_region)
+            detections = self._detect_tab_text(tab_region)
             
-            # Sort by horizontal position (tabs are left to right)
-            detections.sort(key=lambda x: x['bbox'][0])
-            
-            tabs = []
-            last_x = -100  # Track position to avoid duplicates
-            
-            for det in detections:
-                text = det['text'].strip()
-                x_pos = det['bbox'][0]
-                
-                # Tabs should be:
-                # 1. At least some distance apart (not same text repeated)
-                # 2. Short-ish (not full sentences from page content)
-                # 3. Not UI elements
-                if (text and 
-                    2 < len(text) < 60 and  # Reasonable tab title length
-                    x_pos - last_x > 30 and  # At least 30px apart (new tab)
-                    text not in ['×', '+', '...', 'New Tab', 'Google', 'Chrome'] and
-                    not text.startswith('http') and
-                    not text.startswith('www')):
-                    
-                    tabs.append(text)
-                    last_x = x_pos
+            tabs = self._filter_tab_titles(detections)
             
             # If we got nothing, try a slightly different region
             if len(tabs) == 0:
@@ -79,13 +164,8 @@ class ScreenAnalyzer:
                     tab_region.save("debug_tab_region_alt.png")
                     print(f"   [DEBUG] Saved alternative region to debug_tab_region_alt.png")
                 
-                detections = self.detector.detect_text(tab_region)
-                detections.sort(key=lambda x: x['bbox'][0])
-                
-                for det in detections:
-                    text = det['text'].strip()
-                    if text and 2 < len(text) < 60:
-                        tabs.append(text)
+                detections = self._detect_tab_text(tab_region)
+                tabs = self._filter_tab_titles(detections, strict=False)
             
             return tabs[:15]  # Return max 15 tabs
             
@@ -105,7 +185,8 @@ class ScreenAnalyzer:
         }
     
     def analyze_window(self, window_identifier: str, capture_screenshot: bool = True, 
-                       detect_text: bool = True, get_ui_tree: bool = False) -> Dict:
+                       detect_text: bool = True, get_ui_tree: bool = False,
+                       return_screenshot: bool = False) -> Dict:
         """
         Analyze a specific window
         
@@ -114,6 +195,8 @@ class ScreenAnalyzer:
             capture_screenshot: Capture window image
             detect_text: Run OCR on window
             get_ui_tree: Get UI element hierarchy (slower)
+            return_screenshot: Include the captured PIL image in the result
+                               (otherwise it is released once analysis is done)
         
         Returns:
             Dictionary with window analysis results
@@ -134,11 +217,19 @@ class ScreenAnalyzer:
             'timestamp': time.time()
         }
         
+        # Window rect is fetched once here and threaded through capture and tab OCR
+        window_bbox = window_info.get('bbox')
+        
         # Capture screenshot if requested
+        screenshot = None
         if capture_screenshot:
-            screenshot = self.capture.capture_window(hwnd)
+            if window_bbox:
+                screenshot = self.capture.capture_window_rect(window_bbox)
+            else:
+                screenshot = self.capture.capture_window(hwnd)
             if screenshot:
-                result['screenshot'] = screenshot
+                if return_screenshot:
+                    result['screenshot'] = screenshot
                 result['screenshot_size'] = screenshot.size
                 
                 # Detect text if requested
@@ -156,11 +247,15 @@ class ScreenAnalyzer:
             result['ui_element_count'] = len(ui_elements)
         
         # Try to get browser tabs
-        tabs = self.inspector.get_browser_tabs(hwnd, screenshot if capture_screenshot else None)
+        tabs = self.inspector.get_browser_tabs(hwnd, screenshot)
         
         # If tabs method returned OCR flag, use OCR on tab bar
         if tabs == ['__USE_OCR__'] and screenshot:
-            tabs = self._extract_tabs_with_ocr(hwnd, screenshot, debug=True)
+            tabs = self._extract_tabs_with_ocr(window_bbox or (0, 0, *screenshot.size), screenshot, debug=True)
+        
+        # Release pixel data now that OCR has consumed it
+        if screenshot and not return_screenshot:
+            screenshot.close()
         
         if tabs:
             result['browser_tabs'] = tabs
@@ -177,7 +272,7 @@ class ScreenAnalyzer:
         return self.analyze_window(active['title'], **kwargs)
     
     def analyze_full_screen(self, monitor_num: int = 1, detect_text: bool = True,
-                           detect_ui: bool = False) -> Dict:
+                           detect_ui: bool = False, return_screenshot: bool = False) -> Dict:
         """
         Analyze entire screen using computer vision
         
@@ -185,20 +280,24 @@ class ScreenAnalyzer:
             monitor_num: Monitor number (1 = primary)
             detect_text: Run OCR on screen
             detect_ui: Detect UI elements with CV
+            return_screenshot: Include a PIL image of the screen in the result
         
         Returns:
             Dictionary with screen analysis results
         """
-        # Capture full screen
-        screenshot = self.capture.capture_full_screen(monitor_num)
+        # Capture full screen as raw BGRX pixels, fed to OCR/CV without a PIL round-trip
+        screenshot = self.capture.capture_full_screen(monitor_num, as_array=True)
+        size = (screenshot.shape[1], screenshot.shape[0])
         
         result = {
             'timestamp': time.time(),
             'monitor_num': monitor_num,
-            'screenshot_size': screenshot.size,
-            'screenshot': screenshot
+            'screenshot_size': size
         }
         
+        if return_screenshot:
+            result['screenshot'] = Image.frombuffer("RGB", size, screenshot, "raw", "BGRX", 0, 1)
+        
         # Detect text
         if detect_text:
             text_detections = self.detector.detect_text(screenshot)
@@ -219,19 +318,30 @@ class ScreenAnalyzer:
         results = []
         all_windows = self.capture.get_all_windows()
         
-        for window in all_windows:
-            try:
-                screenshot = self.capture.capture_window(window['hwnd'])
-                if screenshot:
-                    extracted = self.detector.extract_visible_text(screenshot)
-                    
-                    if search_text.lower() in extracted.lower():
-                        results.append({
-                            'window': window,
-                            'matching_text': extracted
-                        })
-            except:
-                pass
+        if not all_windows:
+            return results
+        
+        # Capture every window first (in parallel) so OCR can run as a single batch
+        shots = self.capture.capture_window_rects([w['bbox'] for w in all_windows])
+        captured = [(w, shot) for w, shot in zip(all_windows, shots) if shot]
+        
+        windows = [w for w, _ in captured]
+        screenshots = [shot for _, shot in captured]
+        
+        try:
+            batch_detections = self.detector.detect_text_batch(screenshots)
+        finally:
+            for screenshot in screenshots:
+                screenshot.close()
+        
+        for window, detections in zip(windows, batch_detections):
+            extracted = self.detector.join_visible_text(detections)
+            
+            if search_text.lower() in extracted.lower():
+                results.append({
+                    'window': window,
+                    'matching_text': extracted
+                })
         
         return results
     
@@ -267,11 +377,12 @@ class ScreenAnalyzer:
         
         summaries = []
         for window in windows:
-            info = self.inspector.get_window_info(window['hwnd'])
+            # Title and bbox are already known from the enumeration
             summaries.append({
-                'name': info['title'],
-                'application': info['process_name'],
-                'hwnd': window['hwnd']
+                'name': window['title'],
+                'application': self.inspector.get_process_name(window['hwnd']),
+                'hwnd': window['hwnd'],
+                'bbox': window['bbox']
             })
         
         return summaries
\ No newline at end of file
@@ -1,13 +1,46 @@
 # bb_generation.py
 
+import os
+import sys
+import glob
 import time
 import json
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import zlib
+import cv2
 import mss
 import numpy as np
+import torch
 from ultralytics import YOLO
 
+# Fixed-size record the detection worker publishes through shared memory
+BB_MAX_DETECTIONS = 256
+BB_DETECTION_DTYPE = np.dtype([
+    ("bbox", "<i4", (4,)),  # x, y, w, h
+    ("confidence", "<f4"),
+    ("class_id", "<i4"),
+    ("class_name", "S32"),
+])
+BB_RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),  # 0 = nothing published yet
+    ("count", "<i4"),
+    ("detections", BB_DETECTION_DTYPE, (BB_MAX_DETECTIONS,)),
+])
+
 class BoundingBoxGenerator:
-    def __init__(self, model_path="best.onnx", interval=5):
+    def __init__(self, model_path="best.onnx", interval=5, imgsz=None):
+        # Use half precision on CUDA, plain FP32 on CPU
+        self.half = torch.cuda.is_available()
+        self.device = 0 if self.half else "cpu"
+        self.imgsz = imgsz  # None = the size the model was exported at
+
+        # Prefer a TensorRT engine exported next to the model when running on GPU
+        engine_path = os.path.splitext(model_path)[0] + ".engine"
+        if self.half and os.path.exists(engine_path):
+            model_path = engine_path
+
         self.model = YOLO(model_path)
         self.interval = interval  # seconds
         
@@ -18,17 +51,52 @@ class BoundingBoxGenerator:
         except:
             self.class_names = {}
 
+        # mss handles are tied to the thread that created them, so keep one per thread
+        self._local = threading.local()
+        self.monitor = self.sct.monitors[1]  # Full screen
+
+        # Contiguous BGR frame reused by every screenshot() (callers must not modify it)
+        self._buf = np.empty((self.monitor["height"], self.monitor["width"], 3), dtype=np.uint8)
+
+        # Fingerprint of the last frame and its detections, to skip static screens
+        self._last_hash = None
+        self._last_detections = []
+
+    @property
+    def sct(self):
+        """Reusable mss instance for the calling thread."""
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+
     def screenshot(self):
-        """Capture full desktop screenshot."""
-        with mss.mss() as sct:
-            monitor = sct.monitors[1]  # Full screen
-            img = sct.grab(monitor)
-            img_np = np.array(img)[:, :, :3]  # Remove alpha channel (BGRA → BGR)
-            return img_np
+        """Capture full desktop screenshot into the reused BGR buffer."""
+        img = self.sct.grab(self.monitor)
+        # View over the BGRA buffer, dropping alpha (BGRA → BGR), packed into self._buf
+        bgra = np.frombuffer(img.bgra, dtype=np.uint8).reshape(img.height, img.width, 4)
+        if self._buf.shape[:2] != bgra.shape[:2]:
+            self._buf = np.empty((img.height, img.width, 3), dtype=np.uint8)  # resolution changed
+        np.copyto(self._buf, bgra[:, :, :3])
+        return self._buf
+
+    @staticmethod
+    def frame_hash(frame):
+        """Cheap fingerprint of a frame (checksum of a 64x36 thumbnail)."""
+        thumb = cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA)
+        return zlib.crc32(thumb.tobytes())
 
     def run_detection(self, frame):
-        """Run YOLO detection on a frame."""
-        results = self.model(frame)
+        """Run YOLO detection on a frame (reuses the last result if the screen is unchanged)."""
+        frame_hash = self.frame_hash(frame)
+        if frame_hash == self._last_hash:
+            return list(self._last_detections)
+
+        options = {"half": self.half, "device": self.device, "verbose": False}
+        if self.imgsz:
+            options["imgsz"] = self.imgsz
+
+        results = self.model.predict(frame, **options)
         detections = []
 
         for r in results:
@@ -45,7 +113,9 @@ class BoundingBoxGenerator:
                     "class_name": cls_name
                 })
 
-        return detections
+        self._last_hash = frame_hash
+        self._last_detections = detections
+        return list(detections)
 
     def start(self):
         """Begin continuous detection every X seconds."""
@@ -65,7 +135,156 @@ class BoundingBoxGenerator:
             time.sleep(self.interval)
 
 
+def bb_worker(shm_name, lock, model_path="best.onnx", interval=5):
+    """Detection loop for a child process; publishes each result into the shared record."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    record = np.ndarray((), dtype=BB_RECORD_DTYPE, buffer=shm.buf)
+    packed = np.zeros(BB_MAX_DETECTIONS, dtype=BB_DETECTION_DTYPE)
+
+    bb = BoundingBoxGenerator(model_path=model_path, interval=interval)
+    print("🔥 YOLO bounding box generator started in worker process")
+    try:
+        while True:
+            try:
+                frame = bb.screenshot()
+                detections = bb.run_detection(frame)[:BB_MAX_DETECTIONS]
+                for i, det in enumerate(detections):
+                    packed[i] = (det["bbox"], det["confidence"], det["class_id"],
+                                 str(det["class_name"]).encode("utf-8")[:32])
+
+                with lock:
+                    record["timestamp"] = time.time()
+                    record["count"] = len(detections)
+                    record["detections"][:len(detections)] = packed[:len(detections)]
+            except Exception as e:
+                print(f"BB loop error: {e}")
+            time.sleep(interval)
+    finally:
+        del record
+        shm.close()
+
+
+class SharedDetections:
+    """
+    Runs bb_worker in its own process and reads its latest result from shared memory,
+    so YOLO inference never competes with the caller for the GIL.
+    """
+
+    def __init__(self):
+        self.shm = shared_memory.SharedMemory(create=True, size=BB_RECORD_DTYPE.itemsize)
+        self.lock = mp.Lock()
+        self._record = np.ndarray((), dtype=BB_RECORD_DTYPE, buffer=self.shm.buf)
+        self._record["timestamp"] = 0.0
+        self._record["count"] = 0
+        self.process = None
+
+    def start(self, model_path="best.onnx", interval=5):
+        self.process = mp.Process(target=bb_worker,
+                                  args=(self.shm.name, self.lock, model_path, interval),
+                                  daemon=True)
+        self.process.start()
+
+    def read(self):
+        """Latest {timestamp, count, detections} published by the worker, or None."""
+        with self.lock:
+            record = self._record.copy()
+
+        if record["timestamp"] == 0:
+            return None
+
+        count = int(record["count"])
+        return {
+            "timestamp": float(record["timestamp"]),
+            "count": count,
+            "detections": [
+                {
+                    "bbox": det["bbox"].tolist(),
+                    "confidence": float(det["confidence"]),
+                    "class_id": int(det["class_id"]),
+                    "class_name": det["class_name"].decode("utf-8", "ignore"),
+                }
+                for det in record["detections"][:count]
+            ],
+        }
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(timeout=1)
+        del self._record
+        self.shm.close()
+        self.shm.unlink()
+
+
+def letterbox(frame, size):
+    """Resize a BGR frame into a (h, w) canvas keeping aspect ratio, padded with gray (YOLO style)."""
+    h, w = size
+    scale = min(h / frame.shape[0], w / frame.shape[1])
+    new_w, new_h = int(round(frame.shape[1] * scale)), int(round(frame.shape[0] * scale))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    canvas = np.full((h, w, 3), 114, dtype=np.uint8)
+    top, left = (h - new_h) // 2, (w - new_w) // 2
+    canvas[top:top + new_h, left:left + new_w] = resized
+    return canvas
+
+
+def collect_calibration_frames(calibration_dir, count=100, delay=1.0):
+    """Save `count` desktop screenshots into calibration_dir (one every `delay` seconds)."""
+    os.makedirs(calibration_dir, exist_ok=True)
+    with mss.mss() as sct:
+        monitor = sct.monitors[1]
+        for i in range(count):
+            img = np.array(sct.grab(monitor))[:, :, :3]
+            cv2.imwrite(os.path.join(calibration_dir, f"calib_{i:03d}.png"), img)
+            time.sleep(delay)
+
+
+def quantize_int8(model_path="best.onnx", output_path="best_int8.onnx",
+                  calibration_dir="calibration", num_frames=100):
+    """
+    Produce a static INT8 (QDQ, per-channel) copy of the YOLO ONNX model,
+    calibrated on representative desktop screenshots.
+    """
+    import onnxruntime as ort
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat,
+                                          QuantType, quantize_static)
+
+    paths = sorted(glob.glob(os.path.join(calibration_dir, "*.png")))
+    if not paths:
+        print(f"Collecting {num_frames} calibration screenshots into {calibration_dir}/ ...")
+        collect_calibration_frames(calibration_dir, count=num_frames)
+        paths = sorted(glob.glob(os.path.join(calibration_dir, "*.png")))
+
+    session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    input_size = tuple(model_input.shape[2:4])
+    if not all(isinstance(d, int) for d in input_size):
+        input_size = (640, 640)  # dynamic export; use the YOLO default
+
+    class ScreenshotReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(paths)
+
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            img = letterbox(cv2.imread(path), input_size)
+            blob = img[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0  # BGR→RGB, HWC→NCHW
+            return {model_input.name: np.ascontiguousarray(blob)}
+
+    quantize_static(model_path, output_path, ScreenshotReader(),
+                    quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QInt8, weight_type=QuantType.QInt8)
+    print(f"✓ Saved INT8 model to {output_path}")
+
+
 # Run standalone
 if __name__ == "__main__":
-    bb = BoundingBoxGenerator("best.onnx", interval=5)
-    bb.start()
+    if len(sys.argv) > 1 and sys.argv[1] == "quantize":
+        # python bb_generation.py quantize [calibration_dir]
+        quantize_int8(calibration_dir=sys.argv[2] if len(sys.argv) > 2 else "calibration")
+    else:
+        bb = BoundingBoxGenerator("best.onnx", interval=5)
+        bb.start()
@@ -3,22 +3,56 @@ Screen Capture Module for Desktop Pet AI
 Handles all screenshot operations for windows and full screen
 """
 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import mss
 import numpy as np
 from PIL import Image
 import win32gui
 import win32ui
 import win32con
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Union
 
 class ScreenCapture:
     """High-performance screen capture with window targeting"""
     
+    # Seconds an enumerated window list stays valid
+    WINDOWS_CACHE_TTL = 0.1
+    
+    # Threads used to capture many windows at once
+    CAPTURE_WORKERS = 8
+    
     def __init__(self):
-        self.sct = mss.mss()
+        # mss keeps its GDI handles in thread-local storage, so keep one instance per thread
+        self._local = threading.local()
+        self._windows_cache = (0.0, [])
+        self._executor = ThreadPoolExecutor(max_workers=self.CAPTURE_WORKERS, thread_name_prefix="capture")
+    
+    @property
+    def sct(self):
+        """Reusable mss instance for the calling thread"""
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._local.sct = mss.mss()
+        return sct
+    
+    @staticmethod
+    def _to_image(screenshot) -> Image.Image:
+        """Decode an mss grab straight from its raw BGRA buffer (no intermediate bytes copy)"""
+        return Image.frombuffer("RGB", screenshot.size, screenshot.raw, "raw", "BGRX", 0, 1)
+    
+    @staticmethod
+    def _to_array(screenshot) -> np.ndarray:
+        """View an mss grab as an (H, W, 4) BGRX array without copying"""
+        return np.frombuffer(screenshot.raw, dtype=np.uint8).reshape(screenshot.height, screenshot.width, 4)
     
     def get_all_windows(self) -> List[dict]:
         """Get all visible windows with their info"""
+        cached_at, cached = self._windows_cache
+        if time.monotonic() - cached_at < self.WINDOWS_CACHE_TTL:
+            return list(cached)
+        
         windows = []
         
         def callback(hwnd, _):
@@ -38,7 +72,8 @@ class ScreenCapture:
             return True
         
         win32gui.EnumWindows(callback, None)
-        return windows
+        self._windows_cache = (time.monotonic(), windows)
+        return list(windows)
     
     def find_window(self, title_substring: str) -> Optional[int]:
         """Find window handle by title (case-insensitive)"""
@@ -55,10 +90,43 @@ class ScreenCapture:
         win32gui.EnumWindows(callback, results)
         return results[0] if results else None
     
-    def capture_window(self, hwnd: int) -> Optional[Image.Image]:
-        """Capture specific window by handle"""
+    def capture_window(self, hwnd: int, as_array: bool = False) -> Optional[Union[Image.Image, np.ndarray]]:
+        """Capture specific window by handle (as_array returns the raw BGRX pixels)"""
+        try:
+            rect = win32gui.GetWindowRect(hwnd)
+        except Exception as e:
+            print(f"Error capturing window: {e}")
+            return None
+        
+        return self.capture_window_rect(rect, as_array=as_array)
+    
+    def capture_window_rect(self, rect: Tuple[int, int, int, int],
+                            as_array: bool = False) -> Optional[Union[Image.Image, np.ndarray]]:
+        """Capture a window whose (left, top, right, bottom) rect is already known"""
+        return self._grab_rect(self.sct, rect, as_array)
+    
+    def capture_window_rects(self, rects: List[Tuple[int, int, int, int]]) -> List[Optional[Image.Image]]:
+        """Capture several window rects in parallel (None for any that fail), in input order"""
+        def grab(rect):
+            # Scoped mss instance: its GDI handles are released before the worker moves on
+            with mss.mss() as sct:
+                return self._grab_rect(sct, rect)
+        
+        return list(self._executor.map(grab, rects))
+    
+    def close(self):
+        """Stop the capture workers and release the calling thread's mss handles"""
+        self._executor.shutdown(wait=True)
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+    
+    def _grab_rect(self, sct, rect: Tuple[int, int, int, int],
+                   as_array: bool = False) -> Optional[Union[Image.Image, np.ndarray]]:
+        """Grab a (left, top, right, bottom) rect with the given mss instance"""
         try:
-            left, top, right, bottom = win32gui.GetWindowRect(hwnd)
+            left, top, right, bottom = rect
             width = right - left
             height = bottom - top
             
@@ -72,22 +140,23 @@ class ScreenCapture:
                 "height": height
             }
             
-            screenshot = self.sct.grab(monitor)
-            return Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+            screenshot = sct.grab(monitor)
+            return self._to_array(screenshot) if as_array else self._to_image(screenshot)
         except Exception as e:
             print(f"Error capturing window: {e}")
             return None
     
-    def capture_full_screen(self, monitor_num: int = 1) -> Image.Image:
-        """Capture entire monitor"""
+    def capture_full_screen(self, monitor_num: int = 1, as_array: bool = False) -> Union[Image.Image, np.ndarray]:
+        """Capture entire monitor (as_array returns the raw BGRX pixels)"""
         screenshot = self.sct.grab(self.sct.monitors[monitor_num])
-        return Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+        return self._to_array(screenshot) if as_array else self._to_image(screenshot)
     
-    def capture_region(self, x: int, y: int, width: int, height: int) -> Image.Image:
-        """Capture specific screen region"""
+    def capture_region(self, x: int, y: int, width: int, height: int,
+                       as_array: bool = False) -> Union[Image.Image, np.ndarray]:
+        """Capture specific screen region (as_array returns the raw BGRX pixels)"""
         monitor = {"left": x, "top": y, "width": width, "height": height}
         screenshot = self.sct.grab(monitor)
-        return Image.frombytes("RGB", screenshot.size, screenshot.bgra, "raw", "BGRX")
+        return self._to_array(screenshot) if as_array else self._to_image(screenshot)
     
     def get_active_window(self) -> Optional[dict]:
         """Get currently focused window"""
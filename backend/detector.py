@@ -4,9 +4,13 @@ Uses OCR and CV to detect text and UI elements
 """
 
 import os
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Tuple, Optional, Union
 import warnings
 
 # Suppress ALL warnings including PyTorch pin_memory spam
@@ -16,8 +20,9 @@ os.environ['PYTHONWARNINGS'] = 'ignore'
 # Try importing OCR libraries
 try:
     import pytesseract
+    pytesseract.get_tesseract_version()  # the pip package is useless without the binary
     TESSERACT_AVAILABLE = True
-except ImportError:
+except Exception:
     TESSERACT_AVAILABLE = False
     print("⚠️ Tesseract not available - install for better OCR")
 
@@ -35,109 +40,411 @@ except ImportError:
     CV2_AVAILABLE = False
     print("⚠️ OpenCV not available - some features disabled")
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+
+# Detector inputs: PIL images (RGB) or numpy arrays straight from capture (BGR/BGRX)
+ImageLike = Union[Image.Image, np.ndarray]
+
+# Number of OCR results kept for unchanged images
+OCR_CACHE_SIZE = 32
+
+# Longest image side passed to EasyOCR; larger screenshots are downscaled first
+OCR_MAX_SIDE = 1280
+
+# Images per batched EasyOCR forward pass on GPU (CRAFT activations grow with the batch)
+OCR_BATCH_SIZE = 4
+
+def _image_size(image: ImageLike) -> Tuple[int, int]:
+    """(width, height) of a PIL image or pixel array"""
+    if isinstance(image, np.ndarray):
+        return image.shape[1], image.shape[0]
+    return image.size
+
+
+def _to_ocr_array(image: ImageLike) -> np.ndarray:
+    """Pixel array for the OCR engines; arrays are passed through, dropping any alpha channel once"""
+    if isinstance(image, np.ndarray):
+        if image.ndim == 3 and image.shape[2] == 4:
+            return np.ascontiguousarray(image[:, :, :3])
+        return image
+    return np.array(image)
+
+
+def _resize(image: ImageLike, size: Tuple[int, int]) -> ImageLike:
+    """Bilinear resize that keeps the input type"""
+    if isinstance(image, np.ndarray):
+        if CV2_AVAILABLE:
+            return cv2.resize(_to_ocr_array(image), size, interpolation=cv2.INTER_LINEAR)
+        return np.array(Image.fromarray(_to_ocr_array(image)).resize(size, Image.BILINEAR))
+    return image.resize(size, Image.BILINEAR)
+
+
+def _letterbox_batch(arrays: List[np.ndarray], max_side: int) -> Tuple[List[np.ndarray], List[float], Tuple[int, int]]:
+    """
+    Scale each array (aspect ratio kept) so its longest side fits max_side, then
+    zero-pad them bottom/right to one shared size so they can be batched
+    
+    Returns:
+        Padded arrays, per-array scale factors, and the shared (width, height)
+    """
+    scaled, scales = [], []
+    for array in arrays:
+        h, w = array.shape[:2]
+        scale = min(1.0, max_side / max(w, h))
+        if scale < 1.0:
+            array = _resize(array, (max(1, round(w * scale)), max(1, round(h * scale))))
+        scaled.append(array)
+        scales.append(scale)
+    
+    width = max(a.shape[1] for a in scaled)
+    height = max(a.shape[0] for a in scaled)
+    padded = []
+    for array in scaled:
+        canvas = np.zeros((height, width) + array.shape[2:], dtype=array.dtype)
+        canvas[:array.shape[0], :array.shape[1]] = array
+        padded.append(canvas)
+    
+    return padded, scales, (width, height)
+
+
+# UI element types, indexed by the ids produced by the classifier kernels
+UI_ELEMENT_TYPES = np.array(['button', 'icon', 'menu_bar', 'container'])
+
+
+def _classify_rects_numpy(rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Vectorized classifier; returns (type_ids, areas, aspect_ratios) with -1 for noise"""
+    w, h = rects[:, 2], rects[:, 3]
+    area = w * h
+    
+    # Classify by aspect ratio
+    aspect_ratio = w / np.maximum(h, 1)
+    type_ids = np.select(
+        [
+            area < 100,  # Filter small noise
+            (aspect_ratio > 2) & (aspect_ratio < 10) & (h < 50),
+            (aspect_ratio > 0.8) & (aspect_ratio < 1.2),
+            aspect_ratio > 10
+        ],
+        [-1, 0, 1, 2],
+        default=3
+    ).astype(np.int32)
+    
+    return type_ids, area, aspect_ratio
+
+
+def _classify_rects_loop(rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Same classifier as a plain loop, compiled with Numba when available"""
+    n = rects.shape[0]
+    type_ids = np.empty(n, dtype=np.int32)
+    areas = np.empty(n, dtype=np.int32)
+    aspect_ratios = np.empty(n, dtype=np.float64)
+    
+    for i in range(n):
+        w = rects[i, 2]
+        h = rects[i, 3]
+        area = w * h
+        aspect_ratio = w / max(h, 1)
+        
+        if area < 100:
+            type_id = -1
+        elif 2 < aspect_ratio < 10 and h < 50:
+            type_id = 0
+        elif 0.8 < aspect_ratio < 1.2:
+            type_id = 1
+        elif aspect_ratio > 10:
+            type_id = 2
+        else:
+            type_id = 3
+        
+        type_ids[i] = type_id
+        areas[i] = area
+        aspect_ratios[i] = aspect_ratio
+    
+    return type_ids, areas, aspect_ratios
+
+
+if NUMBA_AVAILABLE:
+    # nogil lets other threads (e.g. action execution) run while classifying
+    _classify_rects_kernel = njit(cache=True, nogil=True)(_classify_rects_loop)
+else:
+    _classify_rects_kernel = _classify_rects_numpy
+
+
+def _classify_rects(rects: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Filter and classify UI element bounding rectangles by aspect ratio
+    
+    Args:
+        rects: (N, 4) int32 array of x, y, w, h
+    
+    Returns:
+        Surviving rects with their element types, areas and aspect ratios
+    """
+    type_ids, areas, aspect_ratios = _classify_rects_kernel(np.ascontiguousarray(rects, dtype=np.int32))
+    keep = type_ids >= 0
+    
+    return rects[keep], UI_ELEMENT_TYPES[type_ids[keep]], areas[keep], aspect_ratios[keep]
+
 
 class ContentDetector:
     """Detect text and UI elements from screenshots"""
     
-    def __init__(self, ocr_engine: str = "easyocr", use_gpu: bool = False):
+    def __init__(self, ocr_engine: str = "easyocr", use_gpu: bool = False, warmup: bool = True):
         """
         Initialize detector
         
         Args:
             ocr_engine: "easyocr", "tesseract", or "both"
             use_gpu: Use GPU for EasyOCR (faster but needs CUDA)
+            warmup: Run dummy OCR passes at startup so the first real call is fast
         """
         self.ocr_engine = ocr_engine
         self.easyocr_reader = None
         
+        # OCR results for recently seen images, keyed on a checksum of their pixels
+        self._ocr_cache = OrderedDict()
+        self._ocr_cache_lock = threading.Lock()
+        
         if ocr_engine in ["easyocr", "both"] and EASYOCR_AVAILABLE:
             try:
                 # Silence warnings during EasyOCR initialization
                 import logging
                 logging.getLogger('easyocr').setLevel(logging.ERROR)
                 
-                self.easyocr_reader = easyocr.Reader(['en'], gpu=use_gpu, verbose=False)
+                self.easyocr_reader = easyocr.Reader(['en'], gpu=use_gpu, verbose=False,
+                                                     cudnn_benchmark=True, quantize=True)
                 print("✓ EasyOCR initialized")
+                
+                if not use_gpu:
+                    self._quantize_reader()
+                
+                if warmup:
+                    self._warmup_reader(use_gpu)
             except Exception as e:
                 print(f"⚠️ EasyOCR failed to init: {e}")
         
         if ocr_engine in ["tesseract", "both"] and not TESSERACT_AVAILABLE:
             print("⚠️ Tesseract not available")
     
-    def detect_text_easyocr(self, image: Image.Image) -> List[Dict]:
-        """Detect text using EasyOCR"""
+    def _warmup_reader(self, use_gpu: bool):
+        """Run dummy passes at the shapes real calls use, so kernel/algorithm selection happens at startup"""
+        try:
+            if use_gpu:
+                import torch.backends.cudnn as cudnn
+                cudnn.benchmark = True
+            
+            # Tab strip, and a full screen after the OCR_MAX_SIDE downscale
+            for shape in [(40, 1600), (720, OCR_MAX_SIDE)]:
+                self.easyocr_reader.readtext(np.zeros((*shape, 3), np.uint8))
+            
+            # Batched window search
+            if use_gpu:
+                self.easyocr_reader.readtext_batched(np.zeros([2, 600, 800, 3], np.uint8),
+                                                     n_width=800, n_height=600)
+        except Exception as e:
+            print(f"⚠️ EasyOCR warmup failed: {e}")
+    
+    def _quantize_reader(self):
+        """Apply dynamic int8 quantization to the CPU models (for older EasyOCR builds)"""
+        try:
+            import torch
+            
+            for name in ('recognizer', 'detector'):
+                module = getattr(self.easyocr_reader, name, None)
+                if module is not None:
+                    torch.quantization.quantize_dynamic(
+                        module, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True
+                    )
+        except Exception as e:
+            # Unsupported build - keep running at fp32
+            print(f"⚠️ EasyOCR quantization skipped: {e}")
+    
+    def detect_text_easyocr(self, image: ImageLike, max_side: Optional[int] = OCR_MAX_SIDE) -> List[Dict]:
+        """
+        Detect text using EasyOCR
+        
+        Args:
+            image: Image to run OCR on
+            max_side: Downscale so the longest side is at most this many pixels
+                      before OCR (None = never resize); boxes are mapped back
+        """
         if not self.easyocr_reader:
             return []
         
         try:
-            img_array = np.array(image)
-            results = self.easyocr_reader.readtext(img_array)
+            scale = 1.0
+            width, height = _image_size(image)
+            if max_side and max(width, height) > max_side:
+                scale = max_side / max(width, height)
+                image = _resize(image, (int(width * scale), int(height * scale)))
             
-            detections = []
-            for bbox, text, confidence in results:
-                # Convert bbox to [x1, y1, x2, y2]
-                x_coords = [point[0] for point in bbox]
-                y_coords = [point[1] for point in bbox]
-                
-                detections.append({
-                    'text': text,
-                    'bbox': [
-                        int(min(x_coords)),
-                        int(min(y_coords)),
-                        int(max(x_coords)),
-                        int(max(y_coords))
-                    ],
-                    'confidence': float(confidence),
-                    'engine': 'easyocr'
-                })
-            
-            return detections
+            img_array = _to_ocr_array(image)
+            results = self.easyocr_reader.readtext(img_array)
+            return self._parse_easyocr_results(results, 1 / scale, 1 / scale)
         except Exception as e:
             print(f"EasyOCR error: {e}")
             return []
     
-    def detect_text_tesseract(self, image: Image.Image) -> List[Dict]:
-        """Detect text using Tesseract"""
+    def detect_text_batch(self, images: List[ImageLike],
+                          max_side: int = OCR_MAX_SIDE) -> List[List[Dict]]:
+        """
+        Detect text in several images, batching EasyOCR calls on GPU
+        
+        Args:
+            images: Images to run OCR on
+            max_side: Longest side each image is downscaled to (aspect ratio kept)
+                before being padded to a common batch size
+        
+        Returns:
+            One list of detections per input image, in input order
+        """
+        if not images:
+            return []
+        
+        if not self.easyocr_reader or self.ocr_engine == "tesseract":
+            # Tesseract runs out of process, so OCR the images concurrently instead
+            with ThreadPoolExecutor(max_workers=min(8, len(images))) as executor:
+                return list(executor.map(self.detect_text, images))
+        
+        if str(getattr(self.easyocr_reader, 'device', 'cpu')) == 'cpu':
+            # Batching buys nothing on CPU; per-image calls skip padding and hit the OCR cache
+            return [self.detect_text(image, max_side=max_side) for image in images]
+        
+        arrays = [
+            _to_ocr_array(image if isinstance(image, np.ndarray) else image.convert("RGB"))
+            for image in images
+        ]
+        
+        # Small batches of similarly sized images keep memory bounded and padding low
+        order = sorted(range(len(arrays)), key=lambda i: arrays[i].shape[0] * arrays[i].shape[1])
+        detections = [[] for _ in images]
+        for start in range(0, len(order), OCR_BATCH_SIZE):
+            group = order[start:start + OCR_BATCH_SIZE]
+            try:
+                # Letterbox rather than stretch, so wide windows keep legible text
+                padded, scales, (width, height) = _letterbox_batch([arrays[i] for i in group], max_side)
+                batch_results = self.easyocr_reader.readtext_batched(padded, n_width=width, n_height=height)
+                
+                for i, scale, results in zip(group, scales, batch_results):
+                    # Images sit at the top-left of the canvas, so only the scale needs undoing
+                    detections[i] = self._parse_easyocr_results(results, 1 / scale, 1 / scale)
+            except Exception as e:
+                print(f"EasyOCR batch error: {e}")
+        
+        return detections
+    
+    @staticmethod
+    def _parse_easyocr_results(results, scale_x: float = 1.0, scale_y: float = 1.0) -> List[Dict]:
+        """Convert raw EasyOCR output to detection dicts"""
+        detections = []
+        for bbox, text, confidence in results:
+            # Convert bbox to [x1, y1, x2, y2]
+            x_coords = [point[0] * scale_x for point in bbox]
+            y_coords = [point[1] * scale_y for point in bbox]
+            
+            detections.append({
+                'text': text,
+                'bbox': [
+                    int(min(x_coords)),
+                    int(min(y_coords)),
+                    int(max(x_coords)),
+                    int(max(y_coords))
+                ],
+                'confidence': float(confidence),
+                'engine': 'easyocr'
+            })
+        
+        return detections
+    
+    def detect_text_tesseract(self, image: ImageLike, psm: Optional[int] = None) -> List[Dict]:
+        """
+        Detect text using Tesseract
+        
+        Args:
+            image: Image to run OCR on
+            psm: Optional Tesseract page segmentation mode (7 = single text line)
+        """
         if not TESSERACT_AVAILABLE:
             return []
         
         try:
-            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+            if isinstance(image, np.ndarray):
+                image = _to_ocr_array(image)
             
-            detections = []
-            n_boxes = len(data['text'])
+            config = f"--psm {psm}" if psm is not None else ""
+            data = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.DICT)
             
-            for i in range(n_boxes):
-                text = data['text'][i].strip()
-                conf = int(data['conf'][i])
-                
-                if text and conf > 0:  # Only include confident detections
-                    x, y, w, h = data['left'][i], data['top'][i], data['width'][i], data['height'][i]
-                    detections.append({
-                        'text': text,
-                        'bbox': [x, y, x + w, y + h],
-                        'confidence': conf / 100.0,
-                        'engine': 'tesseract'
-                    })
+            if not data['text']:
+                return []
+            
+            texts = np.char.strip(np.asarray(data['text'], dtype=str))
+            confs = np.asarray(data['conf'], dtype=np.float64).astype(np.int32)
+            
+            # Only include confident, non-empty detections
+            keep = (confs > 0) & (texts != '')
+            
+            xs = np.asarray(data['left'])[keep]
+            ys = np.asarray(data['top'])[keep]
+            ws = np.asarray(data['width'])[keep]
+            hs = np.asarray(data['height'])[keep]
+            
+            detections = [
+                {
+                    'text': text,
+                    'bbox': [x, y, x + w, y + h],
+                    'confidence': conf / 100.0,
+                    'engine': 'tesseract'
+                }
+                for text, conf, x, y, w, h in zip(
+                    texts[keep].tolist(), confs[keep].tolist(),
+                    xs.tolist(), ys.tolist(), ws.tolist(), hs.tolist()
+                )
+            ]
             
             return detections
         except Exception as e:
             print(f"Tesseract error: {e}")
             return []
     
-    def detect_text(self, image: Image.Image) -> List[Dict]:
-        """Detect all text in image using available OCR engine"""
-        if self.ocr_engine == "easyocr" or (self.ocr_engine == "both" and self.easyocr_reader):
-            return self.detect_text_easyocr(image)
-        elif self.ocr_engine == "tesseract" or self.ocr_engine == "both":
-            return self.detect_text_tesseract(image)
-        else:
-            return []
+    def detect_text(self, image: ImageLike, max_side: Optional[int] = OCR_MAX_SIDE) -> List[Dict]:
+        """Detect all text in image using available OCR engine (cached per identical image)"""
+        # Convert a PIL image once; the key hashes that buffer and OCR reuses the array
+        image = np.ascontiguousarray(image)
+        key = (zlib.crc32(image), image.shape, image.dtype.str, max_side)
+        
+        with self._ocr_cache_lock:
+            cached = self._ocr_cache.get(key)
+            if cached is not None:
+                self._ocr_cache.move_to_end(key)
+        
+        if cached is None:
+            if self.ocr_engine == "easyocr" or (self.ocr_engine == "both" and self.easyocr_reader):
+                cached = self.detect_text_easyocr(image, max_side=max_side)
+            elif self.ocr_engine == "tesseract" or self.ocr_engine == "both":
+                cached = self.detect_text_tesseract(image)
+            else:
+                return []
+            
+            with self._ocr_cache_lock:
+                self._ocr_cache[key] = cached
+                if len(self._ocr_cache) > OCR_CACHE_SIZE:
+                    self._ocr_cache.popitem(last=False)
+        
+        # Callers may shift boxes in place, so hand out copies
+        return [dict(d, bbox=list(d['bbox'])) for d in cached]
     
-    def detect_text_in_region(self, image: Image.Image, bbox: Tuple[int, int, int, int]) -> List[Dict]:
+    def detect_text_in_region(self, image: ImageLike, bbox: Tuple[int, int, int, int]) -> List[Dict]:
         """Detect text in specific region of image"""
         x1, y1, x2, y2 = bbox
-        region = image.crop((x1, y1, x2, y2))
+        if isinstance(image, np.ndarray):
+            region = image[y1:y2, x1:x2]
+        else:
+            region = image.crop((x1, y1, x2, y2))
         
         detections = self.detect_text(region)
         
@@ -150,60 +457,60 @@ class ContentDetector:
         
         return detections
     
-    def detect_ui_elements(self, image: Image.Image) -> List[Dict]:
+    def detect_ui_elements(self, image: ImageLike) -> List[Dict]:
         """Detect UI elements using computer vision"""
         if not CV2_AVAILABLE:
             return []
         
         try:
-            # Convert to OpenCV format
-            img_array = np.array(image)
-            gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+            # Convert to OpenCV format (arrays are already BGR/BGRX)
+            if isinstance(image, np.ndarray) and image.ndim == 2:
+                gray = image
+            elif isinstance(image, np.ndarray):
+                conversion = cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+                gray = cv2.cvtColor(image, conversion)
+            else:
+                gray = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2GRAY)
             
-            # Edge detection
-            edges = cv2.Canny(gray, 50, 150)
+            # Segment foreground/background with a single Otsu threshold; on light themes
+            # the elements are the dark pixels, so invert to keep them as foreground
+            polarity = cv2.THRESH_BINARY_INV if cv2.mean(gray)[0] > 127 else cv2.THRESH_BINARY
+            _, binarized = cv2.threshold(gray, 0, 255, polarity + cv2.THRESH_OTSU)
             
-            # Find contours
-            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            # Connected components already come with bounding boxes
+            _, _, stats, _ = cv2.connectedComponentsWithStats(binarized, connectivity=8)
             
-            elements = []
-            for contour in contours:
-                # Get bounding rectangle
-                x, y, w, h = cv2.boundingRect(contour)
-                area = w * h
-                
-                # Filter small noise
-                if area < 100:
-                    continue
-                
-                # Classify by aspect ratio
-                aspect_ratio = w / h if h > 0 else 0
-                
-                if 2 < aspect_ratio < 10 and h < 50:
-                    element_type = "button"
-                elif 0.8 < aspect_ratio < 1.2:
-                    element_type = "icon"
-                elif aspect_ratio > 10:
-                    element_type = "menu_bar"
-                else:
-                    element_type = "container"
-                
-                elements.append({
+            # Bounding rectangles as an (N, 4) array of x, y, w, h (row 0 is the background)
+            rects = stats[1:, :4].astype(np.int32)
+            if not len(rects):
+                return []
+            
+            rects, element_types, areas, aspect_ratios = _classify_rects(rects)
+            
+            elements = [
+                {
                     'type': element_type,
                     'bbox': [x, y, x + w, y + h],
                     'area': area,
                     'aspect_ratio': aspect_ratio
-                })
+                }
+                for (x, y, w, h), element_type, area, aspect_ratio in zip(
+                    rects.tolist(), element_types.tolist(), areas.tolist(), aspect_ratios.tolist()
+                )
+            ]
             
             return elements
         except Exception as e:
             print(f"UI detection error: {e}")
             return []
     
-    def extract_visible_text(self, image: Image.Image, confidence_threshold: float = 0.5) -> str:
+    def extract_visible_text(self, image: ImageLike, confidence_threshold: float = 0.5) -> str:
         """Extract all visible text as single string"""
-        detections = self.detect_text(image)
-        
+        return self.join_visible_text(self.detect_text(image), confidence_threshold)
+    
+    @staticmethod
+    def join_visible_text(detections: List[Dict], confidence_threshold: float = 0.5) -> str:
+        """Combine detections into a single top-to-bottom string"""
         # Filter by confidence
         filtered = [d for d in detections if d['confidence'] >= confidence_threshold]
         
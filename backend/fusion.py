@@ -6,11 +6,43 @@ import subprocess
 import webbrowser
 
 
+# Host OS, looked up once ("windows", "darwin" for macOS, "linux")
+_SYSTEM = platform.system().lower()
+
+# Per-platform commands for the keyboard/launcher actions
+_OPEN_CHROME_CMDS = {
+    "windows": [r"C:\Program Files\Google\Chrome\Application\chrome.exe"],
+    "darwin": ["open", "-a", "Google Chrome"],
+    "linux": ["google-chrome"],
+}
+
+_CLOSE_TAB_CMDS = {
+    "windows": ["powershell", "-Command",
+                "(new-object -com wscript.shell).SendKeys('^w')"],
+    "darwin": ["osascript", "-e",
+               'tell application "System Events" to keystroke "w" using command down'],
+    "linux": ["xdotool", "key", "ctrl+w"],
+}
+
+_CLOSE_ALL_CMDS = {
+    "windows": ["powershell", "-Command",
+                "(new-object -com wscript.shell).SendKeys('%{F4}')"],
+    "darwin": ["osascript", "-e",
+               'tell application "System Events" to keystroke "q" using command down'],
+    "linux": ["xdotool", "key", "alt+F4"],
+}
+
+
 # ======================================================================
 # ACTION EXECUTOR (URL-based + Chrome launcher)
 # ======================================================================
 class ActionExecutor:
 
+    # Commands for the current OS, resolved once at import (None = unsupported)
+    _OPEN_CHROME_CMD = _OPEN_CHROME_CMDS.get(_SYSTEM)
+    _CLOSE_TAB_CMD = _CLOSE_TAB_CMDS.get(_SYSTEM)
+    _CLOSE_ALL_CMD = _CLOSE_ALL_CMDS.get(_SYSTEM)
+
     # ------------------------------------------------------------
     # OPEN APPLICATION / WEBSITE
     # ------------------------------------------------------------
@@ -43,80 +75,41 @@ class ActionExecutor:
     # OPEN GOOGLE CHROME (system dependent)
     # ------------------------------------------------------------
     def open_chrome(self):
-        system = platform.system().lower()
+        if self._OPEN_CHROME_CMD is None:
+            return "Unsupported operating system."
 
         try:
-            if system == "windows":
-                subprocess.Popen([
-                    r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-                ])
-                return "Opening Chrome."
-
-            if system == "darwin":  # macOS
-                subprocess.Popen(["open", "-a", "Google Chrome"])
-                return "Opening Chrome."
-
-            if system == "linux":
-                subprocess.Popen(["google-chrome"])
-                return "Opening Chrome."
-
+            subprocess.Popen(self._OPEN_CHROME_CMD)
+            return "Opening Chrome."
         except Exception as e:
             return f"Failed to open Chrome: {e}"
 
-        return "Unsupported operating system."
-
     # ------------------------------------------------------------
     # CLOSE CURRENT TAB
     # ------------------------------------------------------------
     def close_current_tab(self):
-        system = platform.system().lower()
+        if self._CLOSE_TAB_CMD is None:
+            return "Unsupported OS."
 
         try:
-            if system == "windows":
-                subprocess.Popen(["powershell", "-Command",
-                    "(new-object -com wscript.shell).SendKeys('^w')"])
-                return "Closing the current tab."
-
-            if system == "darwin":
-                subprocess.Popen(["osascript", "-e",
-                    'tell application "System Events" to keystroke "w" using command down'])
-                return "Closing the current tab."
-
-            if system == "linux":
-                subprocess.Popen(["xdotool", "key", "ctrl+w"])
-                return "Closing the current tab."
-
+            subprocess.Popen(self._CLOSE_TAB_CMD)
+            return "Closing the current tab."
         except Exception as e:
             return f"Failed to close tab: {e}"
 
-        return "Unsupported OS."
-
     # ------------------------------------------------------------
     # CLOSE ALL WINDOWS (safe shortcut)
     # ------------------------------------------------------------
     def close_all_windows(self):
-        system = platform.system().lower()
+        if self._CLOSE_ALL_CMD is None:
+            return "Unsupported OS."
 
         try:
-            if system == "windows":
-                subprocess.Popen(["powershell", "-Command",
-                    "(new-object -com wscript.shell).SendKeys('%{F4}')"])
-                return "Closing all windows."
-
-            if system == "darwin":
-                subprocess.Popen(["osascript", "-e",
-                    'tell application "System Events" to keystroke "q" using command down'])
-                return "Closing all windows."
-
-            if system == "linux":
-                subprocess.Popen(["xdotool", "key", "alt+F4"])
-                return "Closing all windows."
-
+            subprocess.Popen(self._CLOSE_ALL_CMD)
+            return "Closing all windows."
         except Exception as e:
             return f"Failed: {e}"
 
-        return "Unsupported OS."
-
     # ------------------------------------------------------------
     # PLAY MUSIC → SOUNDLOUD.COM
     # ------------------------------------------------------------
@@ -1,32 +1,161 @@
 # intent_engine.py
 
-from sentence_transformers import SentenceTransformer, util
+from collections import OrderedDict
+from functools import lru_cache
+import os
+import threading
+
+from sentence_transformers import SentenceTransformer
 import torch
+import torch.nn.functional as F
 import re
-import spacy
-# Load small English model for lemmatization and stop words
-nlp = spacy.load("en_core_web_sm", disable=["parser", "ner"])
+from spacy.lang.en.stop_words import STOP_WORDS
+
+# Optional: int8 ONNX Runtime backend for the embedding model
+try:
+    import onnxruntime as ort
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Inference only: no autograd bookkeeping, and leave half the cores to the server
+torch.set_grad_enabled(False)
+torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+try:
+    torch.set_num_interop_threads(1)
+except RuntimeError:
+    pass  # already fixed by an earlier torch user in this process
 
 # -----------------------------------------------------------
 # Preprocessing
 # -----------------------------------------------------------
+# spaCy's English stop word list, without loading a pipeline
+STOP = frozenset(STOP_WORDS)
+_NON_ALNUM_RE = re.compile(r"[^a-z0-9\s]")
+
+# Sliding-window separators ("..." is covered by the +)
+_SPLIT_RE = re.compile(r"[.,!?;]+")
+
+@lru_cache(maxsize=2048)
 def preprocess_text(text: str) -> str:
     """
-    Lowercase, remove punctuation, lemmatize, remove stopwords,
+    Lowercase, remove punctuation, remove stopwords,
     normalize whitespace.
     """
-    text = text.lower()
-    text = re.sub(r"[^a-z0-9\s]", " ", text)
-    text = re.sub(r"\s+", " ", text).strip()
-
-    doc = nlp(text)
-    tokens = [token.lemma_ for token in doc if not token.is_stop]
-    return " ".join(tokens)
+    tokens = _NON_ALNUM_RE.sub(" ", text.lower()).split()
+    return " ".join(t for t in tokens if t not in STOP)
 
 # -----------------------------------------------------------
 # Model
 # -----------------------------------------------------------
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_ID = "sentence-transformers/all-MiniLM-L6-v2"
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "all-MiniLM-L6-v2-int8")
+ONNX_MODEL_FILE = "model_quantized.onnx"
+ONNX_GPU_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "all-MiniLM-L6-v2-fp16")
+ONNX_GPU_MODEL_FILE = "model_optimized.onnx"
+
+# "onnx" (int8 ONNX Runtime, when installed) or "torch" (plain SentenceTransformer)
+INTENT_BACKEND = os.environ.get("INTENT_BACKEND", "onnx")
+
+
+class OnnxSentenceEncoder:
+    """
+    Drop-in for SentenceTransformer.encode backed by an ONNX Runtime session
+    (int8 on CPU, FP16 with IOBinding on CUDA): tokenize, run, mean-pool,
+    optionally L2-normalize.
+    """
+
+    def __init__(self, model_dir: str, file_name: str = ONNX_MODEL_FILE,
+                 provider: str = "CPUExecutionProvider"):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.device = "cuda" if provider == "CUDAExecutionProvider" else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        # With IOBinding, inputs/outputs stay on the GPU instead of round-tripping through numpy
+        self.session = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=file_name, session_options=options,
+            provider=provider, use_io_binding=self.device == "cuda"
+        )
+
+    @staticmethod
+    def export(model_dir: str):
+        """Export MiniLM to ONNX and apply dynamic int8 quantization (one-off)."""
+        print("Exporting int8 ONNX intent model (first run only)...")
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+        quantizer = ORTQuantizer.from_pretrained(ort_model)
+        config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=model_dir, quantization_config=config)
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(model_dir)
+
+    @staticmethod
+    def export_fp16(model_dir: str):
+        """Export MiniLM to ONNX with GPU graph fusions and FP16 weights (one-off)."""
+        print("Exporting FP16 ONNX intent model for CUDA (first run only)...")
+        ort_model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+        optimizer = ORTOptimizer.from_pretrained(ort_model)
+        config = OptimizationConfig(optimization_level=99, fp16=True, optimize_for_gpu=True)
+        optimizer.optimize(save_dir=model_dir, optimization_config=config)
+        AutoTokenizer.from_pretrained(MODEL_ID).save_pretrained(model_dir)
+
+    def encode(self, sentences, batch_size=32, convert_to_tensor=False, normalize_embeddings=False):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        chunks = []
+        for start in range(0, len(sentences), batch_size):
+            batch = self.tokenizer(sentences[start:start + batch_size], padding=True,
+                                   truncation=True, max_length=256, return_tensors="pt")
+            if self.device == "cuda":
+                batch = {k: v.to("cuda", non_blocking=True) for k, v in batch.items()}
+            hidden = self.session(**batch).last_hidden_state.float()  # pool in FP32
+
+            # Mean pooling over real (non-padding) tokens
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            chunks.append((hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9))
+
+        embeddings = torch.cat(chunks)
+        if normalize_embeddings:
+            embeddings = F.normalize(embeddings, dim=1)
+        if single:
+            embeddings = embeddings[0]
+        return embeddings if convert_to_tensor else embeddings.cpu().numpy()
+
+
+def load_model():
+    """
+    Load the FP16 ONNX encoder on CUDA, else the int8 ONNX encoder on CPU,
+    else the PyTorch SentenceTransformer.
+    """
+    if INTENT_BACKEND == "onnx" and ONNX_AVAILABLE:
+        if torch.cuda.is_available() and "CUDAExecutionProvider" in ort.get_available_providers():
+            try:
+                if not os.path.exists(os.path.join(ONNX_GPU_MODEL_DIR, ONNX_GPU_MODEL_FILE)):
+                    OnnxSentenceEncoder.export_fp16(ONNX_GPU_MODEL_DIR)
+                encoder = OnnxSentenceEncoder(ONNX_GPU_MODEL_DIR, file_name=ONNX_GPU_MODEL_FILE,
+                                              provider="CUDAExecutionProvider")
+                print("✓ Intent model loaded (FP16 ONNX Runtime, CUDA)")
+                return encoder
+            except Exception as e:
+                print(f"⚠️ CUDA ONNX intent model unavailable, using int8 CPU: {e}")
+
+        try:
+            if not os.path.exists(os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE)):
+                OnnxSentenceEncoder.export(ONNX_MODEL_DIR)
+            encoder = OnnxSentenceEncoder(ONNX_MODEL_DIR)
+            print("✓ Intent model loaded (int8 ONNX Runtime)")
+            return encoder
+        except Exception as e:
+            print(f"⚠️ ONNX intent model unavailable, using PyTorch: {e}")
+
+    return SentenceTransformer("all-MiniLM-L6-v2").eval()
+
+
+model = load_model()
 
 # -----------------------------------------------------------
 # Extended canonical commands with casual/filler variations
@@ -68,81 +197,175 @@ def extract_keywords(text: str) -> str:
     tokens = text.split()
     return " ".join([t for t in tokens if t in COMMAND_KEYWORDS])
 
+# -----------------------------------------------------------
+# Keyword fast path (matched on the raw lowercased text, since
+# preprocessing drops stop words like "all")
+# -----------------------------------------------------------
+_FAST_PATTERNS = [
+    (re.compile(r"\bclose\b.*\ball\b.*\bwindows?\b"), "close_all_windows"),
+    (re.compile(r"\bclose\b.*\btab\b"), "close_current_tab"),
+    (re.compile(r"\bopen\b.*\b(chrome|youtube|whatsapp|chatgpt)\b"), None),  # label from the app
+]
+_FAST_APP_RE = re.compile(r"\b(chrome|youtube|whatsapp|chatgpt)\b")
+_NEGATION_RE = re.compile(r"\b(not|never|don'?t|dont)\b")
+
+def fast_intent(user_text: str):
+    """Return the label for an unambiguous keyword command, else None."""
+    text = user_text.lower()
+    if _NEGATION_RE.search(text):
+        return None
+
+    labels = set()
+    for pattern, label in _FAST_PATTERNS:
+        match = pattern.search(text)
+        if match is None:
+            continue
+        if label is None:
+            apps = set(_FAST_APP_RE.findall(text))
+            if len(apps) > 1:
+                return None  # "open youtube on chrome"
+            label = "open_" + apps.pop()
+        labels.add(label)
+
+    # Mixed commands ("close the tab and open chrome") go to the model
+    return labels.pop() if len(labels) == 1 else None
+
 # -----------------------------------------------------------
 # Precompute embeddings for canonical commands
 # -----------------------------------------------------------
 command_texts = []
 command_labels = []
 
+# Several phrasings collapse to the same text once stop words are gone
+# ("can you open chrome" -> "open chrome"), so encode each one only once
 for label, examples in COMMANDS.items():
-    for ex in examples:
-        clean_ex = preprocess_text(ex)
+    for clean_ex in dict.fromkeys(preprocess_text(ex) for ex in examples):
         command_texts.append(clean_ex)
         command_labels.append(label)
 
-command_embeddings = model.encode(command_texts, convert_to_tensor=True)
+# L2-normalized so cosine similarity is a plain matmul; the transpose is
+# materialized once so every request multiplies against a contiguous matrix
+command_embeddings = model.encode(command_texts, convert_to_tensor=True, normalize_embeddings=True)
+command_embeddings = F.normalize(command_embeddings, dim=1)
+
+# Half precision on GPU (half the bandwidth, plenty for cosine scores);
+# CPU half matmul is emulated and slower, so keep FP32 there
+COMMAND_DTYPE = torch.float16 if command_embeddings.is_cuda else torch.float32
+command_embeddings = command_embeddings.to(COMMAND_DTYPE).contiguous()
+command_embeddings_t = command_embeddings.T.contiguous()  # (dim, commands)
+
+# Warm the single-sentence path so the first request doesn't pay for it
+model.encode(["warmup"], convert_to_tensor=True)
+
+# -----------------------------------------------------------
+# Embedding cache for repeated phrases (voice commands repeat a lot)
+# -----------------------------------------------------------
+EMBEDDING_CACHE_SIZE = 2048
+_emb_cache = OrderedDict()
+_emb_lock = threading.Lock()
+
+def encode_cached(texts: list) -> torch.Tensor:
+    """
+    Return L2-normalized embeddings (one row per text), reusing cached results.
+    All cache misses are encoded together in a single batched forward pass.
+    """
+    with _emb_lock:
+        embs = [_emb_cache.get(t) for t in texts]
+        for t, emb in zip(texts, embs):
+            if emb is not None:
+                _emb_cache.move_to_end(t)
+
+    misses = list(dict.fromkeys(t for t, emb in zip(texts, embs) if emb is None))
+    if misses:
+        # sentence-transformers sorts by length internally, so padding stays minimal
+        encoded = model.encode(misses, batch_size=32, convert_to_tensor=True,
+                               normalize_embeddings=True)
+        fresh = dict(zip(misses, encoded))
+        embs = [fresh[t] if emb is None else emb for t, emb in zip(texts, embs)]
+
+        with _emb_lock:
+            _emb_cache.update(fresh)
+            while len(_emb_cache) > EMBEDDING_CACHE_SIZE:
+                _emb_cache.popitem(last=False)
+
+    return torch.stack(embs)
 
 # -----------------------------------------------------------
 # Intent classification with sliding window & keyword boosting
 # -----------------------------------------------------------
+@torch.inference_mode()
 def classify_intent(user_text: str):
     """Robust semantic intent detection for continuous speech."""
+    # 0. Obvious commands never need the transformer
+    fast_label = fast_intent(user_text)
+    if fast_label is not None:
+        return build_intent(fast_label)
+
     clean_text = preprocess_text(user_text)
 
     # 1. Sliding window: split by punctuation to handle stories
-    split_chars = [".", ",", "!", "?", ";", "..."]
-    windows = [clean_text]
-    for char in split_chars:
-        new_windows = []
-        for w in windows:
-            new_windows.extend([part.strip() for part in w.split(char) if part.strip()])
-        windows = new_windows
+    #    (the common case has none left after preprocessing: one window, no splitting)
+    if _SPLIT_RE.search(clean_text):
+        windows = [w for w in (part.strip() for part in _SPLIT_RE.split(clean_text)) if w]
+    else:
+        windows = [clean_text] if clean_text else []
 
     best_score = 0
     best_label = "none"
     best_window = ""
 
-    # 2. Evaluate each window
-    for window in windows:
-        # Keyword boosting: append keywords to window
-        keywords_text = extract_keywords(window)
-        augmented_text = window + " " + keywords_text if keywords_text else window
+    # 2. Evaluate all windows in one batch
+    if windows:
+        # Keyword boosting: append keywords to each window
+        augmented = []
+        for window in windows:
+            keywords_text = extract_keywords(window)
+            augmented.append(window + " " + keywords_text if keywords_text else window)
+
+        user_embs = encode_cached(augmented)
+        user_embs = user_embs.to(command_embeddings_t.device, COMMAND_DTYPE)
+        scores = torch.matmul(user_embs, command_embeddings_t).float()  # (windows, commands)
 
-        user_emb = model.encode(augmented_text, convert_to_tensor=True)
-        cos_scores = util.cos_sim(user_emb, command_embeddings)[0]
-        idx = torch.argmax(cos_scores).item()
-        score = float(cos_scores[idx])
+        # Flattened argmax keeps the first window on ties, like the old loop
+        flat_idx = int(torch.argmax(scores))
+        window_idx, idx = divmod(flat_idx, scores.shape[1])
+        score = float(scores[window_idx, idx])
 
         if score > best_score:
             best_score = score
             best_label = command_labels[idx]
-            best_window = window
+            best_window = windows[window_idx]
 
     # 3. Threshold
     threshold = 0.5 if len(clean_text.split()) <= 5 else 0.4
     if best_score < threshold:
         return {"intent": "none", "slots": {}, "reply": "Sorry, I didn't understand that."}
 
-    # 4. Slot extraction
+    return build_intent(best_label)
+
+# -----------------------------------------------------------
+# Reply map
+# -----------------------------------------------------------
+REPLY_MAP = {
+    "open_youtube": "Opening YouTube.",
+    "open_chrome": "Opening Chrome.",
+    "open_whatsapp": "Opening WhatsApp.",
+    "open_chatgpt": "Opening ChatGPT.",
+    "close_current_tab": "Closing the current tab.",
+    "close_all_windows": "Closing all windows.",
+    "play_music": "Playing music.",
+    "whats_on_screen": "Let me check what I see on screen.",
+    "none": "Sorry, I didn't understand that."
+}
+
+def build_intent(label: str):
+    """Intent result dict (with app slot and reply) for a command label."""
     slots = {}
-    if best_label in APP_SLOTS:
-        slots["app"] = APP_SLOTS[best_label]
-
-    # 5. Reply map
-    reply_map = {
-        "open_youtube": "Opening YouTube.",
-        "open_chrome": "Opening Chrome.",
-        "open_whatsapp": "Opening WhatsApp.",
-        "open_chatgpt": "Opening ChatGPT.",
-        "close_current_tab": "Closing the current tab.",
-        "close_all_windows": "Closing all windows.",
-        "play_music": "Playing music.",
-        "whats_on_screen": "Let me check what I see on screen.",
-        "none": "Sorry, I didn't understand that."
-    }
+    if label in APP_SLOTS:
+        slots["app"] = APP_SLOTS[label]
 
     return {
-        "intent": best_label.replace("_", " "),
+        "intent": label.replace("_", " "),
         "slots": slots,
-        "reply": reply_map[best_label]
+        "reply": REPLY_MAP[label]
     }
@@ -5,19 +5,18 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"  # Suppress TensorFlow logs
 import warnings
 warnings.filterwarnings("ignore")
 
-import random
+import asyncio
+import itertools
 import json
-import threading
-import time
+import orjson
 from fastapi import FastAPI, UploadFile, File, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
-from stt import transcribe_wav
-from intent_engine import classify_intent
 from fusion import fusion
 from analyzer import ScreenAnalyzer
-from bb_generation import BoundingBoxGenerator
-from tts import get_tts_instance
+from bb_generation import SharedDetections
+from tts import get_tts_instance, preload_tts, SAMPLE_RATE
 
 import uvicorn
 # --------------------------------------------------------------------
@@ -32,35 +31,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --------------------------------------------------------------------
+# Speech / intent models
+# --------------------------------------------------------------------
+# stt and intent_engine load their models on import, so import them in a startup
+# hook: the YOLO worker process (spawn) re-runs this module and must not load them
+transcribe_wav = None
+classify_intent = None
+
+@app.on_event("startup")
+def load_speech_models():
+    global transcribe_wav, classify_intent
+    from stt import transcribe_wav
+    from intent_engine import classify_intent
+
 # --------------------------------------------------------------------
 # Initialize YOLO BoundingBoxGenerator
 # --------------------------------------------------------------------
-bb_generator = BoundingBoxGenerator(model_path="best.onnx", interval=5)
-bb_generator.latest_result = None  # store latest detections
+# Use the INT8 model from `python bb_generation.py quantize` when it has been built
+BB_MODEL_PATH = "best_int8.onnx" if os.path.exists("best_int8.onnx") else "best.onnx"
+bb_shared = None  # SharedDetections, created on startup
 
-# Add a lock to guard latest_result access
-bb_lock = threading.Lock()
+# Run YOLO in its own process (started with the server, not on import, so
+# spawn-based children re-importing this module don't start another one)
+@app.on_event("startup")
+def start_bb_worker():
+    global bb_shared
+    bb_shared = SharedDetections()
+    bb_shared.start(model_path=BB_MODEL_PATH, interval=5)
 
-def bb_loop():
-    """Background loop to continuously update latest_result."""
-    print("🔥 YOLO bounding box generator started in background")
-    while True:
-        try:
-            frame = bb_generator.screenshot()
-            detections = bb_generator.run_detection(frame)
-            res = {
-                "timestamp": time.time(),
-                "count": len(detections),
-                "detections": detections
-            }
-            with bb_lock:
-                bb_generator.latest_result = res
-        except Exception as e:
-            print(f"BB loop error: {e}")
-        time.sleep(bb_generator.interval)
+@app.on_event("shutdown")
+def stop_bb_worker():
+    if bb_shared is not None:
+        bb_shared.close()
 
-# Start YOLO in a separate thread to avoid blocking FastAPI
-threading.Thread(target=bb_loop, daemon=True).start()
+# Load and warm Kokoro in the background so the first /tts request doesn't pay for it
+@app.on_event("startup")
+def start_tts_preload():
+    preload_tts()
 
 # --------------------------------------------------------------------
 # Initialize Screen Analyzer
@@ -70,44 +78,44 @@ screen_analyzer = ScreenAnalyzer(
     use_gpu=False
 )
 
+# Load EasyOCR (and its warmup passes) in the background so the first /cv request doesn't pay for it
+@app.on_event("startup")
+def start_ocr_preload():
+    screen_analyzer.preload_detector()
+
+@app.on_event("shutdown")
+def stop_screen_analyzer():
+    screen_analyzer.close()
+
 # --------------------------------------------------------------------
 # WebSocket connections
 # --------------------------------------------------------------------
 connections = set()
+connections_lock = asyncio.Lock()
 
 async def broadcast(message: dict):
     """Send Unity-safe JSON to all connections."""
-    def sanitize(obj):
-        if isinstance(obj, dict):
-            sanitized = {}
-            for k, v in obj.items():
-                if isinstance(v, (int, float, str, bool, list, type(None))):
-                    sanitized[k] = v
-                elif isinstance(v, dict):
-                    sanitized[k] = sanitize(v)
-                else:
-                    sanitized[k] = str(v)
-            return sanitized
-        elif isinstance(obj, list):
-            return [sanitize(i) for i in obj]
-        else:
-            return str(obj)
-
-    safe_message = sanitize(message)
-    data = json.dumps(safe_message)
-    for ws in list(connections):
-        try:
-            await ws.send_text(data)
-        except Exception:
-            try:
-                connections.remove(ws)
-            except:
-                pass
+    # orjson natively handles numpy scalars/arrays and tuples; anything else falls back to str()
+    data = orjson.dumps(
+        message,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        default=str
+    ).decode()
+
+    # Send to every client concurrently so one slow socket doesn't delay the rest
+    conns = tuple(connections)
+    results = await asyncio.gather(*(ws.send_text(data) for ws in conns), return_exceptions=True)
+
+    dead = [ws for ws, result in zip(conns, results) if isinstance(result, Exception)]
+    if dead:
+        async with connections_lock:
+            connections.difference_update(dead)
 
 @app.websocket("/ws")
 async def ws_endpoint(ws: WebSocket):
     await ws.accept()
-    connections.add(ws)
+    async with connections_lock:
+        connections.add(ws)
     print("✅ WebSocket connected")
     try:
         while True:
@@ -127,12 +135,18 @@ async def ws_endpoint(ws: WebSocket):
             except Exception:
                 break
     finally:
-        try:
-            connections.remove(ws)
-        except:
-            pass
+        async with connections_lock:
+            connections.discard(ws)
         print("🔌 WebSocket disconnected")
 
+# --------------------------------------------------------------------
+# Request IDs (itertools.count is atomic under the GIL, so ids never repeat)
+# --------------------------------------------------------------------
+_uid = itertools.count(1)
+
+def next_uid() -> int:
+    return next(_uid)
+
 # --------------------------------------------------------------------
 # Helper: Broadcast NLP + Action messages (3A)
 # --------------------------------------------------------------------
@@ -175,7 +189,7 @@ async def broadcast_nlp_and_action(uid: int, text: str, nlp: dict, action: dict)
 @app.post("/stt")
 async def nlp_from_audio(file: UploadFile = File(...)):
     audio_bytes = await file.read()
-    uid = random.randint(10000, 99999)
+    uid = next_uid()
 
     # 1. Transcribe audio
     try:
@@ -206,7 +220,7 @@ async def nlp_from_audio(file: UploadFile = File(...)):
 @app.post("/nlp/text")
 async def nlp_from_text(data: dict):
     user_text = (data.get("text", "") or "").strip()
-    uid = random.randint(10000, 99999)
+    uid = next_uid()
 
     # 1. Classify intent and fuse
     nlp = classify_intent(user_text)
@@ -234,7 +248,7 @@ async def mock_action():
         "action": "open_app",
         "slots": {"app": "chrome"},
         "status": "ok",
-        "id": 1
+        "id": next_uid()
     }
     await broadcast(payload)
     return payload
@@ -278,15 +292,7 @@ async def cv_analyze_active():
         "objects": objects
     }
 
-    # Optionally, broadcast each object as screen_object (Unity-friendly)
     await broadcast(payload)
-    for obj in objects:
-        await broadcast({
-            "type": "screen_object",
-            "object_name": obj["object"],
-            "confidence": obj["confidence"],
-            "bbox": obj["bbox"]
-        })
 
     return payload
 
@@ -312,13 +318,6 @@ async def cv_analyze_all():
     }
 
     await broadcast(payload)
-    for obj in objects:
-        await broadcast({
-            "type": "screen_object",
-            "object_name": obj["object"],
-            "confidence": obj["confidence"],
-            "bbox": obj["bbox"]
-        })
 
     return payload
 
@@ -351,13 +350,6 @@ async def cv_analyze_window(data: dict):
     }
 
     await broadcast(payload)
-    for obj in objects:
-        await broadcast({
-            "type": "screen_object",
-            "object_name": obj["object"],
-            "confidence": obj["confidence"],
-            "bbox": obj["bbox"]
-        })
 
     return payload
 
@@ -384,13 +376,6 @@ async def cv_search(data: dict):
     }
 
     await broadcast(payload)
-    for obj in objects:
-        await broadcast({
-            "type": "screen_object",
-            "object_name": obj["object"],
-            "confidence": obj["confidence"],
-            "bbox": obj["bbox"]
-        })
 
     return payload
 
@@ -416,13 +401,6 @@ async def cv_summaries():
     }
 
     await broadcast(payload)
-    for obj in objects:
-        await broadcast({
-            "type": "screen_object",
-            "object_name": obj["object"],
-            "confidence": obj["confidence"],
-            "bbox": obj["bbox"]
-        })
 
     return payload
 
@@ -431,8 +409,7 @@ async def cv_summaries():
 # --------------------------------------------------------------------
 @app.get("/cv/bb")
 async def get_bounding_boxes():
-    with bb_lock:
-        latest = bb_generator.latest_result
+    latest = bb_shared.read() if bb_shared is not None else None
 
     if latest is None:
         payload = {
@@ -458,13 +435,6 @@ async def get_bounding_boxes():
         }
 
         await broadcast(payload)
-        for obj in objects:
-            await broadcast({
-                "type": "screen_object",
-                "object_name": obj["object"],
-                "confidence": obj["confidence"],
-                "bbox": obj["bbox"]
-            })
 
         return payload
 
@@ -505,8 +475,49 @@ async def text_to_speech(data: dict):
             "status": "failed"
         }
 
+@app.post("/tts/stream")
+async def text_to_speech_stream(data: dict):
+    """
+    Stream speech as raw PCM while it is being synthesized (first sentence plays first).
+    Request: {"text": "Hello world", "voice": "af_heart", "speed": 1.0}
+    Response: 16-bit mono PCM chunks (audio/pcm), rate in the X-Sample-Rate header
+    """
+    try:
+        text = (data.get("text", "") or "").strip()
+        voice = data.get("voice", "af_heart")
+        speed = data.get("speed", 1.0)
+
+        if not text:
+            return {"error": "No text provided", "status": "failed"}
+
+        # Load, voice and first-sentence errors surface here, before any headers are sent
+        tts = get_tts_instance(voice=voice)
+        chunks = tts.synthesize_stream(text, voice=voice, speed=speed)
+        first = next(chunks)
+    except StopIteration:
+        return {"error": "No audio generated", "status": "failed"}
+    except Exception as e:
+        return {"error": str(e), "status": "failed"}
+
+    def stream():
+        yield first
+        try:
+            yield from chunks
+        except Exception as e:
+            # Headers are already out; end the stream cleanly with what was sent
+            print(f"❌ TTS stream failed: {e}")
+        finally:
+            chunks.close()  # disconnects cancel the remaining sentences
+
+    return StreamingResponse(
+        stream(),
+        media_type="audio/pcm",
+        headers={"X-Sample-Rate": str(SAMPLE_RATE)}
+    )
+
 if __name__ == "__main__":
     print("🚀 AI Companion Backend (main.py) starting on http://127.0.0.1:5000")
     print("📡 WebSocket endpoint: ws://127.0.0.1:5000/ws")
     print("🎤 TTS endpoint: POST http://127.0.0.1:5000/tts")
+    print("🎤 TTS stream endpoint: POST http://127.0.0.1:5000/tts/stream")
     uvicorn.run(app, host="127.0.0.1", port=5000)
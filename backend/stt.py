@@ -1,24 +1,37 @@
+import io
 import os
-import tempfile
+from math import gcd
 
 import numpy as np
 import torch
 import scipy.io.wavfile as wavfile
 import scipy.signal as sps
-import whisper
+
+# Prefer faster-whisper (CTranslate2, int8 kernels); fall back to openai-whisper
+try:
+    from faster_whisper import WhisperModel
+    FASTER_WHISPER_AVAILABLE = True
+except ImportError:
+    import whisper
+    FASTER_WHISPER_AVAILABLE = False
 
 # Load Whisper once (tiny model is fast and lightweight)
-model = whisper.load_model("tiny")
+if FASTER_WHISPER_AVAILABLE:
+    model = WhisperModel("tiny.en", device="cpu", compute_type="int8",
+                         cpu_threads=max(1, (os.cpu_count() or 2) // 2))
+else:
+    model = whisper.load_model("tiny")
 
 
-def _load_audio_no_ffmpeg(path: str) -> np.ndarray:
-    """Load WAV without ffmpeg/torchaudio; return mono 16 kHz float32 numpy array."""
-    sr, data = wavfile.read(path)
+def _load_audio_no_ffmpeg(source) -> np.ndarray:
+    """Load WAV (path or file-like) without ffmpeg/torchaudio; return mono 16 kHz float32 numpy array."""
+    sr, data = wavfile.read(source)
 
     # Convert to float32 and normalize to [-1, 1]
     if np.issubdtype(data.dtype, np.integer):
-        max_int = np.iinfo(data.dtype).max
-        data = data.astype(np.float32) / max_int
+        scale = np.float32(1.0 / np.iinfo(data.dtype).max)
+        data = data.astype(np.float32)
+        np.multiply(data, scale, out=data)
     else:
         data = data.astype(np.float32)
         peak = np.max(np.abs(data)) if data.size else 1.0
@@ -27,13 +40,13 @@ def _load_audio_no_ffmpeg(path: str) -> np.ndarray:
 
     # If stereo/multi-channel, average to mono
     if data.ndim > 1:
-        data = data.mean(axis=1)
+        data = data.mean(axis=1, dtype=np.float32)
 
-    # Resample to 16 kHz if needed
+    # Resample to 16 kHz if needed (polyphase FIR, rational up/down factors)
     target_sr = 16000
     if sr != target_sr:
-        new_len = int(len(data) * target_sr / sr)
-        data = sps.resample(data, new_len)
+        g = gcd(sr, target_sr)
+        data = sps.resample_poly(data, target_sr // g, sr // g).astype(np.float32, copy=False)
         sr = target_sr
 
     return data
@@ -41,19 +54,16 @@ def _load_audio_no_ffmpeg(path: str) -> np.ndarray:
 
 def transcribe_wav(file_bytes: bytes) -> str:
     """Convert WAV bytes → text, without needing ffmpeg."""
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
-        f.write(file_bytes)
-        temp_path = f.name
-
-    try:
-        audio = _load_audio_no_ffmpeg(temp_path)
-        result = model.transcribe(audio, fp16=False, language="en")
-        return result.get("text", "").strip()
-    finally:
-        try:
-            os.remove(temp_path)
-        except OSError:
-            pass
+    # Decode straight from memory; both Whisper backends take the numpy array
+    audio = _load_audio_no_ffmpeg(io.BytesIO(file_bytes))
+
+    if FASTER_WHISPER_AVAILABLE:
+        # Greedy decoding; VAD skips leading/trailing silence
+        segments, _ = model.transcribe(audio, language="en", beam_size=1, vad_filter=True)
+        return "".join(segment.text for segment in segments).strip()
+
+    result = model.transcribe(audio, fp16=False, language="en")
+    return result.get("text", "").strip()
 
 
 
@@ -0,0 +1,57 @@
+# test_tts_onnx.py
+
+from types import SimpleNamespace
+
+import numpy as np
+
+from tts import OnnxKokoroPipeline
+
+VOICE_ROWS = 510  # Kokoro voice packs hold one style row per token count, 0..509
+
+
+class FakeSession:
+    """Stands in for the ONNX Runtime session and records the inputs it gets"""
+    
+    def __init__(self):
+        self.calls = []
+    
+    def run(self, outputs, feeds):
+        self.calls.append(feeds)
+        return [np.zeros((1, 240), dtype=np.float32)]
+
+
+def make_pipeline(phonemes):
+    """OnnxKokoroPipeline without model downloads: one G2P chunk of the given phonemes"""
+    pipeline = object.__new__(OnnxKokoroPipeline)
+    pipeline.g2p = lambda text: [SimpleNamespace(graphemes=text, phonemes=phonemes)]
+    pipeline.vocab = {"a": 43}
+    pipeline.session = FakeSession()
+    pipeline._voices = {}
+    return pipeline
+
+
+def test_max_length_chunk_uses_last_style_row():
+    pipeline = make_pipeline("a" * 600)  # longer than the model's 510-token window
+    styles = np.random.rand(VOICE_ROWS, 1, 256).astype(np.float32)
+    
+    chunks = list(pipeline("long text", voice=styles))
+    
+    assert len(chunks) == 1
+    feeds = pipeline.session.calls[0]
+    assert feeds["input_ids"].shape == (1, 512)
+    assert np.array_equal(feeds["style"], styles[VOICE_ROWS - 1])
+
+
+def test_short_chunk_uses_matching_style_row():
+    pipeline = make_pipeline("aaa")
+    styles = np.random.rand(VOICE_ROWS, 1, 256).astype(np.float32)
+    
+    list(pipeline("hi", voice=styles))
+    
+    assert np.array_equal(pipeline.session.calls[0]["style"], styles[3])
+
+
+if __name__ == "__main__":
+    test_max_length_chunk_uses_last_style_row()
+    test_short_chunk_uses_matching_style_row()
+    print("✅ ONNX style lookup OK")
@@ -0,0 +1,40 @@
+# test_ui_elements.py
+
+import numpy as np
+
+from detector import ContentDetector
+
+BUTTON = (20, 20, 120, 50)   # 100x30: wide and short
+ICON = (200, 100, 240, 140)  # 40x40: square
+
+
+def draw_ui(background, foreground):
+    """400x300 BGR frame with a button and an icon drawn on a flat background"""
+    frame = np.full((300, 400, 3), background, dtype=np.uint8)
+    for x1, y1, x2, y2 in (BUTTON, ICON):
+        frame[y1:y2, x1:x2] = foreground
+    return frame
+
+
+def found(elements):
+    return {(e['type'], tuple(e['bbox'])) for e in elements}
+
+
+def test_dark_elements_on_white_background():
+    detector = ContentDetector(ocr_engine="none")
+    elements = detector.detect_ui_elements(draw_ui(background=255, foreground=30))
+    
+    assert found(elements) == {('button', BUTTON), ('icon', ICON)}
+
+
+def test_light_elements_on_dark_background():
+    detector = ContentDetector(ocr_engine="none")
+    elements = detector.detect_ui_elements(draw_ui(background=20, foreground=230))
+    
+    assert found(elements) == {('button', BUTTON), ('icon', ICON)}
+
+
+if __name__ == "__main__":
+    test_dark_elements_on_white_background()
+    test_light_elements_on_dark_background()
+    print("✅ UI element detection OK")
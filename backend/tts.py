@@ -4,8 +4,20 @@ Lightweight, natural-sounding TTS with emotion/style control.
 """
 
 import io
+import os
+import re
+import json
 import base64
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
+from functools import lru_cache
+
 import numpy as np
+import scipy.signal as sps
+import torch
 
 try:
     from kokoro import KPipeline
@@ -13,38 +25,226 @@ try:
 except ImportError:
     raise ImportError("Required packages not found. Install with: pip install kokoro soundfile")
 
+# Optional: int8 ONNX Runtime backend for the Kokoro model
+try:
+    import onnxruntime as ort
+    from huggingface_hub import hf_hub_download
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+SAMPLE_RATE = 24000  # Kokoro outputs at 24kHz
+SYNTH_CACHE_SIZE = 256  # repeated short phrases (UI announcements, replies)
+SYNTH_WORKERS = 2  # sentences synthesized concurrently (each already uses several torch threads)
+
+# (up, down) resampling factors for the speeds users actually pick
+_SPEED_RATIOS = {0.5: (2, 1), 0.75: (4, 3), 1.25: (4, 5), 1.5: (2, 3), 2.0: (1, 2)}
+
+# Sentence boundaries: each sentence is synthesized (and streamed) on its own
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+
+# "torch" (KPipeline) or "onnx" (int8 ONNX Runtime, when installed)
+TTS_BACKEND = os.environ.get("TTS_BACKEND", "torch")
+# TTS_COMPILE=1: torch.compile the Kokoro model (pays off on GPU; compiling costs startup time)
+TTS_COMPILE = os.environ.get("TTS_COMPILE") == "1"
+KOKORO_ONNX_REPO = "onnx-community/Kokoro-82M-v1.0-ONNX"
+KOKORO_ONNX_FILE = "onnx/model_quantized.onnx"
+
+_pipeline_lock = threading.Lock()
+
+# Long-lived sentence workers: a thread's compiled CUDA graphs are recorded once, not per request
+_synth_executor = ThreadPoolExecutor(max_workers=SYNTH_WORKERS, thread_name_prefix="tts-synth")
+
+
+def _to_pcm16(audio, inplace=False):
+    """Float audio in [-1, 1] → little-endian int16 PCM (inplace reuses `audio` as scratch)."""
+    pcm = np.clip(audio, -1.0, 1.0, out=audio if inplace else None)
+    pcm *= 32767
+    return pcm.astype('<i2')
+
+
+_WAV_HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+# Per-thread scratch buffer for building WAV bytes
+_tls = threading.local()
+
+
+def _wav_header(data_size, sample_rate, channels=1, bits=16):
+    """44-byte RIFF/WAVE header for `data_size` bytes of PCM."""
+    block_align = channels * bits // 8
+    return _WAV_HEADER.pack(b'RIFF', 36 + data_size, b'WAVE',
+                            b'fmt ', 16, 1, channels, sample_rate,
+                            sample_rate * block_align, block_align, bits,
+                            b'data', data_size)
+
+
+def _wav_buffer():
+    """This thread's reusable BytesIO, emptied."""
+    buf = getattr(_tls, 'buf', None)
+    if buf is None:
+        buf = _tls.buf = io.BytesIO()
+    buf.seek(0)
+    buf.truncate(0)
+    return buf
+
+
+class OnnxKokoroPipeline:
+    """
+    Drop-in for KPipeline backed by the int8-quantized Kokoro ONNX export:
+    KPipeline (without its model) does the G2P, ONNX Runtime does the synthesis.
+    """
+    
+    def __init__(self, lang_code):
+        self.g2p = KPipeline(lang_code=lang_code, model=False)
+        
+        with open(hf_hub_download(KOKORO_ONNX_REPO, "tokenizer.json"), encoding="utf-8") as f:
+            self.vocab = json.load(f)["model"]["vocab"]
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2)
+        available = ort.get_available_providers()
+        providers = [p for p in ("CUDAExecutionProvider", "DmlExecutionProvider") if p in available]
+        self.session = ort.InferenceSession(
+            hf_hub_download(KOKORO_ONNX_REPO, KOKORO_ONNX_FILE),
+            sess_options=options, providers=providers + ["CPUExecutionProvider"]
+        )
+        self._voices = {}
+    
+    def load_voice(self, voice):
+        """Style vectors for a voice, one (1, 256) row per token count."""
+        if voice not in self._voices:
+            path = hf_hub_download(KOKORO_ONNX_REPO, f"voices/{voice}.bin")
+            self._voices[voice] = np.fromfile(path, dtype=np.float32).reshape(-1, 1, 256)
+        return self._voices[voice]
+    
+    def __call__(self, text, voice, speed=1.0):
+        """Yield (graphemes, phonemes, audio) per chunk, like KPipeline (voice: name or loaded styles)."""
+        styles = voice if isinstance(voice, np.ndarray) else self.load_voice(voice)
+        for result in self.g2p(text):
+            ids = [self.vocab[p] for p in result.phonemes if p in self.vocab][:510]
+            audio = self.session.run(None, {
+                "input_ids": np.array([[0, *ids, 0]], dtype=np.int64),
+                "style": styles[min(len(ids), len(styles) - 1)],  # one row per token count, 0..509
+                "speed": np.array([speed], dtype=np.float32),
+            })[0]
+            yield result.graphemes, result.phonemes, audio[0]
+
+
+@lru_cache(maxsize=4)
+def _pipeline_for(lang_code, backend='torch'):
+    """Shared pipeline per language and backend (the voice is chosen per call, not per pipeline)."""
+    if backend == 'onnx':
+        return OnnxKokoroPipeline(lang_code)
+    
+    if torch.cuda.is_available():
+        device = 'cuda'
+    elif torch.backends.mps.is_available():
+        device = 'mps'
+    else:
+        device = 'cpu'
+    pipeline = KPipeline(lang_code=lang_code, device=device)
+    
+    if TTS_COMPILE:
+        pipeline.model = torch.compile(pipeline.model, mode="reduce-overhead", fullgraph=False)
+        print(f"✓ Kokoro model compiled with torch.compile ({device})")
+    return pipeline
+
 
 class KokoroTTS:
     """Wrapper for Kokoro TTS with female voice options and emotion support."""
     
-    def __init__(self, lang_code='a', voice='af_heart'):
+    def __init__(self, lang_code='a', voice='af_heart', backend=None):
         """
         Initialize Kokoro TTS.
         
         Args:
             lang_code (str): Language code ('a' for English, 'ja' for Japanese, etc.)
-            voice (str): Voice style. Female options: 'af_heart', 'af_bella', 'af_sarah', 'af_Nicole'
+            voice (str): Voice style. Female options: 'af_heart', 'af_bella', 'af_sarah', 'af_nicole'
+            backend (str): 'torch' or 'onnx' (defaults to the TTS_BACKEND env var)
         """
         self.lang_code = lang_code
         self.voice = voice
+        self.backend = backend or TTS_BACKEND
         self.pipeline = None
         self._initialize_pipeline()
         
+        # LRU of (text, voice, speed) → audio
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
         # Female voice options with descriptions
         self.female_voices = {
             'af_heart': 'Warm, emotional, friendly female',
             'af_bella': 'Warm, expressive female',
             'af_sarah': 'Natural, conversational female',
-            'af_Nicole': 'Clear, professional female',
+            'af_nicole': 'Clear, professional female',
         }
+        
+        # Resolved style embeddings per voice name, so calls skip the voice lookup/load
+        self._voice_tensors = {}
+        for voice_id in self.female_voices:
+            try:
+                self._voice_tensor(voice_id)
+            except Exception as e:
+                print(f"⚠ Could not preload voice '{voice_id}': {e}")
+    
+    def _voice_tensor(self, voice):
+        """Style embedding for a voice name, loaded once per instance."""
+        tensor = self._voice_tensors.get(voice)
+        if tensor is None:
+            tensor = self._voice_tensors[voice] = self.pipeline.load_voice(voice)
+        return tensor
     
     def _initialize_pipeline(self):
         """Initialize Kokoro pipeline (lazy loading)."""
         if self.pipeline is None:
             print(f"Loading Kokoro TTS model (lang: {self.lang_code}, voice: {self.voice})...")
-            self.pipeline = KPipeline(lang_code=self.lang_code)
+            # Serialized so concurrent callers don't each build the same pipeline
+            with _pipeline_lock:
+                if self.backend == 'onnx' and ONNX_AVAILABLE:
+                    try:
+                        self.pipeline = _pipeline_for(self.lang_code, 'onnx')
+                    except Exception as e:
+                        print(f"⚠ Kokoro ONNX model unavailable, using PyTorch: {e}")
+                if self.pipeline is None:
+                    self.pipeline = _pipeline_for(self.lang_code)
             print(f"✓ Kokoro TTS loaded successfully")
     
+    def _sentence_frames(self, sentence, voice):
+        """Yield float32 audio frames for one sentence, as the pipeline produces them."""
+        for gs, ps, audio in self.pipeline(sentence, voice=self._voice_tensor(voice)):
+            if audio is None:
+                continue
+            if hasattr(audio, 'cpu'):  # torch tensor
+                audio = audio.cpu().numpy()
+            yield np.asarray(audio, dtype=np.float32)
+    
+    def _synth_one(self, sentence, voice):
+        """All frames for one sentence (runs on a worker thread)."""
+        return list(self._sentence_frames(sentence, voice))
+    
+    def _frames(self, text, voice):
+        """
+        Yield float32 audio frames in sentence order. With several sentences, later
+        ones synthesize on worker threads (torch releases the GIL) while earlier
+        ones are being consumed. Closing the generator (client disconnect) cancels
+        the sentences that have not started yet.
+        """
+        sentences = [s for s in _SENTENCE_RE.split(text.strip()) if s]
+        if len(sentences) <= 1:
+            for sentence in sentences:
+                yield from self._sentence_frames(sentence, voice)
+            return
+        
+        futures = [_synth_executor.submit(self._synth_one, sentence, voice) for sentence in sentences]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+    
     def synthesize(self, text, voice=None, speed=1.0):
         """
         Synthesize text to speech.
@@ -55,35 +255,79 @@ class KokoroTTS:
             speed (float): Speech speed (1.0 = normal)
         
         Returns:
-            tuple: (audio_bytes, sample_rate)
+            tuple: (audio, sample_rate), audio as 16-bit PCM (np.int16)
         """
         if not text or not text.strip():
             raise ValueError("Text cannot be empty")
         
         voice = voice or self.voice
         
+        key = (text, voice, round(speed, 2))
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached, SAMPLE_RATE
+        
         try:
             # Generate speech
-            generator = self.pipeline(text, voice=voice)
-            
-            audio_frames = []
-            for gs, ps, audio in generator:
-                audio_frames.append(audio)
+            audio_frames = list(self._frames(text, voice))
             
-            # Concatenate all frames
-            if audio_frames:
-                audio = np.concatenate(audio_frames)
-            else:
+            # Concatenate all frames into one pre-sized buffer (a single frame is used as-is)
+            if not audio_frames:
                 raise RuntimeError("No audio generated")
+            if len(audio_frames) == 1:
+                audio = audio_frames[0]
+            else:
+                total = sum(frame.shape[0] for frame in audio_frames)
+                audio = np.concatenate(audio_frames, out=np.empty(total, dtype=np.float32))
             
             # Apply speed adjustment if needed
             if speed != 1.0:
                 audio = self._adjust_speed(audio, speed)
-            
-            return audio, 24000  # Kokoro outputs at 24kHz
         
         except Exception as e:
             raise RuntimeError(f"Kokoro synthesis failed: {str(e)}")
+        
+        # Narrow to int16 once here; the float buffer is ours, so scale it in place
+        audio = _to_pcm16(audio, inplace=True)
+        
+        # Shared with later cache hits, so make it read-only
+        audio.flags.writeable = False
+        with self._cache_lock:
+            self._cache[key] = audio
+            while len(self._cache) > SYNTH_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        
+        return audio, SAMPLE_RATE
+    
+    def synthesize_stream(self, text, voice=None, speed=1.0):
+        """
+        Synthesize text to speech, yielding audio as soon as each chunk is ready.
+        
+        Args:
+            text (str): Text to synthesize
+            voice (str): Voice style (uses self.voice if None)
+            speed (float): Speech speed (1.0 = normal)
+        
+        Yields:
+            bytes: Raw 16-bit little-endian mono PCM at SAMPLE_RATE
+        
+        Speed changes resample the whole utterance (per-frame resampling clicks at
+        chunk boundaries), so a non-1.0 speed yields a single chunk.
+        """
+        if not text or not text.strip():
+            raise ValueError("Text cannot be empty")
+        
+        voice = voice or self.voice
+        
+        if abs(speed - 1.0) >= 0.01:
+            audio, _ = self.synthesize(text, voice=voice, speed=speed)
+            yield audio.tobytes()
+            return
+        
+        for audio in self._frames(text, voice):
+            yield _to_pcm16(audio, inplace=True).tobytes()
     
     def synthesize_to_wav(self, text, output_path, voice=None, speed=1.0):
         """
@@ -96,7 +340,7 @@ class KokoroTTS:
             speed (float): Speech speed
         """
         audio, sample_rate = self.synthesize(text, voice=voice, speed=speed)
-        sf.write(output_path, audio, sample_rate)
+        sf.write(output_path, audio, sample_rate, subtype='PCM_16')
         print(f"✓ Saved to {output_path}")
     
     def synthesize_to_base64(self, text, voice=None, speed=1.0):
@@ -113,14 +357,14 @@ class KokoroTTS:
         """
         audio, sample_rate = self.synthesize(text, voice=voice, speed=speed)
         
-        # Save to bytes buffer with format specification
-        audio_buffer = io.BytesIO()
-        sf.write(audio_buffer, audio, sample_rate, format='WAV')
-        audio_buffer.seek(0)
-        audio_bytes = audio_buffer.getvalue()
+        # 16-bit mono WAV is just a fixed header plus the raw samples
+        buf = _wav_buffer()
+        buf.write(_wav_header(audio.nbytes, sample_rate))
+        buf.write(audio)
         
-        # Encode to base64
-        audio_b64 = base64.b64encode(audio_bytes).decode('utf-8')
+        # Encode to base64 straight from the buffer (released before the next reuse)
+        with buf.getbuffer() as view:
+            audio_b64 = base64.b64encode(view).decode('utf-8')
         return audio_b64
     
     def set_voice(self, voice):
@@ -139,27 +383,45 @@ class KokoroTTS:
     @staticmethod
     def _adjust_speed(audio, speed):
         """Adjust audio playback speed without changing pitch."""
-        if speed == 1.0:
+        if abs(speed - 1.0) < 0.01:
             return audio
         
-        # Simple speed adjustment via resampling
-        new_length = int(len(audio) / speed)
-        indices = np.linspace(0, len(audio) - 1, new_length)
-        return np.interp(indices, np.arange(len(audio)), audio)
+        # Polyphase resampling by the rational approximation of 1/speed
+        ratio = _SPEED_RATIOS.get(speed)
+        if ratio is None:
+            frac = Fraction(speed).limit_denominator(100)
+            ratio = (frac.denominator, frac.numerator)
+        up, down = ratio
+        return sps.resample_poly(audio, up, down).astype(np.float32, copy=False)
 
 
 # Global TTS instance for FastAPI integration
 _tts_instance = None
+_tts_lock = threading.Lock()
 
 
 def get_tts_instance(lang_code='a', voice='af_heart'):
     """Get or create Kokoro TTS instance (singleton)."""
     global _tts_instance
     if _tts_instance is None:
-        _tts_instance = KokoroTTS(lang_code=lang_code, voice=voice)
+        with _tts_lock:
+            if _tts_instance is None:
+                _tts_instance = KokoroTTS(lang_code=lang_code, voice=voice)
     return _tts_instance
 
 
+def preload_tts(lang_code='a', voice='af_heart'):
+    """Load the pipeline and run one warmup synthesis in the background."""
+    def warmup():
+        try:
+            get_tts_instance(lang_code=lang_code, voice=voice).synthesize("warmup")
+            print("✓ Kokoro TTS warmed up")
+        except Exception as e:
+            print(f"⚠ Kokoro TTS warmup failed: {e}")
+    
+    threading.Thread(target=warmup, daemon=True).start()
+
+
 if __name__ == "__main__":
     # Test Kokoro TTS
     tts = KokoroTTS(voice='af_heart')
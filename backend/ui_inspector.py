@@ -3,25 +3,47 @@ UI Inspector Module for Desktop Pet AI
 Uses Windows UI Automation to inspect UI elements
 """
 
+import time
+from collections import deque
 import win32gui
 import win32process
 import psutil
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 
 # Try importing pywinauto
 try:
     from pywinauto import Desktop
     from pywinauto.application import Application
+    from pywinauto.controls.uiawrapper import UIAWrapper
+    from pywinauto.uia_defines import IUIA
+    from pywinauto.uia_element_info import UIAElementInfo
     PYWINAUTO_AVAILABLE = True
 except ImportError:
     PYWINAUTO_AVAILABLE = False
     print("⚠️ pywinauto not available - advanced UI inspection disabled")
 
+# UIA control type id for tab items (UIA_TabItemControlTypeId)
+UIA_TABITEM_CONTROL_TYPE_ID = 50019
+
+# Tab-like elements browsers expose that aren't real tabs
+_TAB_JUNK_PREFIXES = ('Active View', 'Tab content')
+
 
 class UIInspector:
     """Inspect Windows UI elements using automation APIs"""
     
+    # Seconds a window info entry stays valid (as long as the window hasn't moved)
+    WINDOW_INFO_TTL = 0.5
+    
+    # Cache sizes above which dead/expired entries are pruned
+    CACHE_PRUNE_SIZE = 256
+    
     def __init__(self):
+        self._winfo_cache: Dict[int, Tuple[float, Dict]] = {}
+        # (pid, create time) -> (process name, exe path); the create time tells a
+        # recycled pid apart from the process that used it before
+        self._process_cache: Dict[Tuple[int, float], Tuple[str, str]] = {}
+        
         if PYWINAUTO_AVAILABLE:
             try:
                 self.desktop = Desktop(backend="uia")
@@ -32,24 +54,45 @@ class UIInspector:
         else:
             self.desktop = None
     
+    def _process_info(self, pid: int) -> Tuple[str, str]:
+        """(name, exe path) of a process, memoized per (pid, create time)"""
+        try:
+            process = psutil.Process(pid)  # reads the create time, not name/exe
+            key = (pid, process.create_time())
+            info = self._process_cache.get(key)
+            if info is None:
+                info = (process.name(), process.exe())
+                if len(self._process_cache) >= self.CACHE_PRUNE_SIZE:
+                    # Forget processes that have exited
+                    live = set(psutil.pids())
+                    self._process_cache = {k: v for k, v in self._process_cache.items() if k[0] in live}
+                self._process_cache[key] = info
+            return info
+        except:
+            return ("Unknown", "Unknown")
+    
     def get_window_info(self, hwnd: int) -> Dict:
         """Get detailed window information"""
         try:
+            rect = win32gui.GetWindowRect(hwnd)
             title = win32gui.GetWindowText(hwnd)
+        except Exception as e:
+            return {'error': str(e)}
+        
+        # Reuse a recent entry unless the window moved, resized or was retitled
+        cached = self._winfo_cache.get(hwnd)
+        if (cached and time.monotonic() - cached[0] < self.WINDOW_INFO_TTL
+                and cached[1]['bbox'] == rect and cached[1]['title'] == title):
+            return dict(cached[1])
+        
+        try:
             class_name = win32gui.GetClassName(hwnd)
-            rect = win32gui.GetWindowRect(hwnd)
             
             # Get process info
             _, pid = win32process.GetWindowThreadProcessId(hwnd)
-            try:
-                process = psutil.Process(pid)
-                process_name = process.name()
-                exe_path = process.exe()
-            except:
-                process_name = "Unknown"
-                exe_path = "Unknown"
+            process_name, exe_path = self._process_info(pid)
             
-            return {
+            info = {
                 'hwnd': hwnd,
                 'title': title,
                 'class': class_name,
@@ -60,9 +103,24 @@ class UIInspector:
                 'visible': win32gui.IsWindowVisible(hwnd),
                 'enabled': win32gui.IsWindowEnabled(hwnd)
             }
+            now = time.monotonic()
+            if len(self._winfo_cache) >= self.CACHE_PRUNE_SIZE:
+                # Drop expired entries (closed windows would otherwise stay forever)
+                self._winfo_cache = {h: entry for h, entry in self._winfo_cache.items()
+                                     if now - entry[0] < self.WINDOW_INFO_TTL}
+            self._winfo_cache[hwnd] = (now, info)
+            return dict(info)
         except Exception as e:
             return {'error': str(e)}
     
+    def get_process_name(self, hwnd: int) -> str:
+        """Get the executable name of the process owning a window"""
+        try:
+            _, pid = win32process.GetWindowThreadProcessId(hwnd)
+        except:
+            return "Unknown"
+        return self._process_info(pid)[0]
+    
     def get_ui_tree(self, hwnd: int, max_depth: int = 5) -> List[Dict]:
         """Get UI element hierarchy for window"""
         if not PYWINAUTO_AVAILABLE or not self.desktop:
@@ -72,47 +130,58 @@ class UIInspector:
         
         try:
             # Find window by handle
-            window = self.desktop.window(handle=hwnd)
+            window = self.desktop.window(handle=hwnd).wrapper_object()
             
-            def traverse(element, depth=0):
-                if depth > max_depth:
-                    return
+            # Breadth-first walk over raw IUIAutomationElements with an explicit queue;
+            # the tree walker hands out one sibling at a time instead of child lists
+            walker = IUIA().iuia.RawViewWalker
+            queue = deque([(window.element_info.element, 0)])
+            while queue:
+                raw, depth = queue.popleft()
                 
                 try:
-                    # Get element info
-                    info = element.element_info
-                    name = info.name if hasattr(info, 'name') else ""
-                    control_type = info.control_type if hasattr(info, 'control_type') else "Unknown"
-                    
-                    # Get bounding box
+                    # Get element info (plain attribute access; hasattr would do each lookup twice)
+                    info = UIAElementInfo(raw)
                     try:
-                        rect = element.rectangle()
-                        bbox = [rect.left, rect.top, rect.right, rect.bottom]
-                    except:
-                        bbox = [0, 0, 0, 0]
+                        name = info.name or ""
+                        control_type = info.control_type or "Unknown"
+                    except AttributeError:
+                        name, control_type = "", "Unknown"
                     
-                    # Only add if has meaningful info
+                    # Only add if has meaningful info (the only nodes that get a wrapper)
                     if name or control_type != "Unknown":
+                        element = UIAWrapper(info)
+                        
+                        # Get bounding box
+                        try:
+                            rect = element.rectangle()
+                            bbox = [rect.left, rect.top, rect.right, rect.bottom]
+                        except:
+                            bbox = [0, 0, 0, 0]
+                        
+                        try:
+                            enabled = element.is_enabled()
+                            visible = element.is_visible()
+                        except AttributeError:
+                            enabled = visible = True
+                        
                         elements.append({
                             'name': name,
                             'type': control_type,
                             'bbox': bbox,
                             'depth': depth,
-                            'enabled': element.is_enabled() if hasattr(element, 'is_enabled') else True,
-                            'visible': element.is_visible() if hasattr(element, 'is_visible') else True
+                            'enabled': enabled,
+                            'visible': visible
                         })
                     
-                    # Traverse children
-                    try:
-                        for child in element.children():
-                            traverse(child, depth + 1)
-                    except:
-                        pass
-                        
-                except Exception as e:
-                    pass
-            
-            traverse(window)
+                    # Children past max_depth would be skipped anyway, so don't queue them
+                    if depth < max_depth:
+                        child = walker.GetFirstChildElement(raw)
+                        while child:  # NULL pointer once there are no more siblings
+                            queue.append((child, depth + 1))
+                            child = walker.GetNextSiblingElement(child)
+                except Exception:
+                    continue
             
         except Exception as e:
             print(f"UI tree error: {e}")
@@ -125,18 +194,30 @@ class UIInspector:
             return None
         
         try:
-            window = self.desktop.window(handle=hwnd)
+            window = self.desktop.window(handle=hwnd).wrapper_object()
             
-            # Search parameters
-            search_kwargs = {}
+            # Search conditions, evaluated inside the automation service
+            uia = IUIA()
+            conditions = []
             if name:
-                search_kwargs['title'] = name
+                conditions.append(uia.iuia.CreatePropertyCondition(
+                    uia.UIA_dll.UIA_NamePropertyId, name))
             if control_type:
-                search_kwargs['control_type'] = control_type
+                conditions.append(uia.iuia.CreatePropertyCondition(
+                    uia.UIA_dll.UIA_ControlTypePropertyId, uia.known_control_types[control_type]))
+            
+            if not conditions:
+                condition = uia.true_condition
+            elif len(conditions) == 1:
+                condition = conditions[0]
+            else:
+                condition = uia.iuia.CreateAndCondition(*conditions)
             
-            element = window.child_window(**search_kwargs)
+            # One FindFirst COM call instead of a Python-side walk of the subtree
+            raw = window.element_info.element.FindFirst(uia.tree_scope["descendants"], condition)
             
-            if element.exists():
+            if raw:
+                element = UIAWrapper(UIAElementInfo(raw))
                 rect = element.rectangle()
                 return {
                     'name': name,
@@ -159,14 +240,34 @@ class UIInspector:
             return None
     
     def list_all_windows(self) -> List[Dict]:
-        """List all visible windows with details"""
+        """
+        List all visible windows with details
+        
+        Fields are gathered inline (one win32 call each); process name and
+        exe path come from the per-process memo.
+        """
         windows = []
         
         def callback(hwnd, _):
             if win32gui.IsWindowVisible(hwnd):
                 title = win32gui.GetWindowText(hwnd)
                 if title:
-                    windows.append(self.get_window_info(hwnd))
+                    try:
+                        _, pid = win32process.GetWindowThreadProcessId(hwnd)
+                        process_name, exe_path = self._process_info(pid)
+                        windows.append({
+                            'hwnd': hwnd,
+                            'title': title,
+                            'class': win32gui.GetClassName(hwnd),
+                            'bbox': win32gui.GetWindowRect(hwnd),
+                            'pid': pid,
+                            'process_name': process_name,
+                            'exe_path': exe_path,
+                            'visible': True,
+                            'enabled': win32gui.IsWindowEnabled(hwnd)
+                        })
+                    except Exception:
+                        pass
             return True
         
         win32gui.EnumWindows(callback, None)
@@ -181,56 +282,37 @@ class UIInspector:
             screenshot: Optional screenshot to use for OCR fallback
         """
         tabs = []
+        seen = set()  # O(1) duplicate check alongside the ordered list
         
         # Method 1: Try UI Automation first (works for some browsers)
         if PYWINAUTO_AVAILABLE and self.desktop:
             try:
-                window = self.desktop.window(handle=hwnd)
+                window = self.desktop.window(handle=hwnd).wrapper_object()
                 
-                def search_tabs(element, depth=0):
-                    if depth > 10:
-                        return
-                    
-                    try:
-                        control_type = element.element_info.control_type.lower()
-                        name = element.element_info.name
-                        
-                        # Look for actual tab items
-                        if 'tabitem' in control_type and name:
-                            # Filter out junk
-                            if (name not in tabs and 
-                                len(name) > 3 and  # Ignore very short names
-                                not name.startswith('Active View') and
-                                not name.startswith('Tab content')):
-                                tabs.append(name)
-                        
-                        try:
-                            for child in element.children():
-                                search_tabs(child, depth + 1)
-                        except:
-                            pass
-                    except:
-                        pass
+                # One native FindAll on the integer control type id (no per-node
+                # string work), reading names straight off the raw elements
+                uia = IUIA()
+                condition = uia.iuia.CreatePropertyCondition(
+                    uia.UIA_dll.UIA_ControlTypePropertyId, UIA_TABITEM_CONTROL_TYPE_ID)
+                found = window.element_info.element.FindAll(uia.tree_scope["descendants"], condition)
                 
-                search_tabs(window)
+                for i in range(found.Length):
+                    name = found.GetElement(i).CurrentName
+                    
+                    # Filter out junk
+                    if (name and
+                        name not in seen and
+                        len(name) > 3 and  # Ignore very short names
+                        not name.startswith(_TAB_JUNK_PREFIXES)):
+                        seen.add(name)
+                        tabs.append(name)
                 
             except Exception as e:
                 pass
         
-        # Method 2: If no tabs found and screenshot provided, use OCR on tab bar area
+        # Method 2: If no tabs found and screenshot provided, flag the analyzer
+        # to use OCR on the tab bar area (it already knows the window rect)
         if len(tabs) == 0 and screenshot is not None:
-            try:
-                # Get window rectangle
-                rect = win32gui.GetWindowRect(hwnd)
-                width = rect[2] - rect[0]
-                
-                # Tab bar is usually top 40-80 pixels
-                tab_region = screenshot.crop((0, 0, width, 80))
-                
-                # We'll return a flag to use OCR in the analyzer
-                return ['__USE_OCR__']
-                
-            except:
-                pass
+            return ['__USE_OCR__']
         
         return tabs
\ No newline at end of file